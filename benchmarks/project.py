@@ -0,0 +1,129 @@
+# Synthetic projects for the benchmarks.
+#
+# A project has `depth` levels of `targets / depth` targets each. Targets of
+# the first level are built from a source file, every other target from
+# `fan_in` targets of the level below, so each target is also used by about
+# `fan_in` targets of the level above. Every level has one rule per
+# directory, written as a percent pattern or as a regular expression, and
+# all targets of the last level are sources of the phony "all" target.
+
+import os
+
+MAKEFILE = """\
+from make_py import phony_task, rule
+
+TARGETS = {per_level}
+FAN_IN = {fan_in}
+DIRECTORIES = {directories}
+
+
+def noop(ctx):
+    pass
+
+
+def target(level, i):
+    return f"build/l{{level}}/d{{i % DIRECTORIES}}/t{{i}}"
+
+
+def inputs(level):
+    def inputs(target, args):
+        i = int(args[0])
+        return [target_of(level - 1, i * FAN_IN + j) for j in range(FAN_IN)]
+
+    return inputs
+
+
+def target_of(level, i):
+    return target(level, i % TARGETS)
+
+
+for d in range(DIRECTORIES):
+    {first_rule}(noop)
+    for level in range(2, {depth} + 1):
+        {rule}(noop)
+
+phony_task("all", [target({depth}, i) for i in range(TARGETS)])
+"""
+
+PERCENT_RULES = {
+    "first": 'rule(f"build/l1/d{d}/t%", [f"src/d{d}/t%.c"])',
+    "rest": 'rule(f"build/l{level}/d{d}/t%", [inputs(level)])',
+}
+
+REGEX_RULES = {
+    "first": r'rule(f"build/l1/d{d}/t(\\d+)", [f"src/d{d}/t{{0}}.c"], regex=True)',
+    "rest": r'rule(f"build/l{level}/d{d}/t(\\d+)", [inputs(level)], regex=True)',
+}
+
+STYLES = {"percent": PERCENT_RULES, "regex": REGEX_RULES}
+
+
+class Project:
+    def __init__(self, targets, rules, fan_in, depth, style="percent"):
+        self.depth = depth
+        self.per_level = max(1, targets // depth)
+        # Rules are spread over the levels, one per directory each
+        self.directories = max(1, rules // depth)
+        self.fan_in = fan_in
+        self.style = style
+
+    @property
+    def targets(self):
+        return self.per_level * self.depth
+
+    @property
+    def rules(self):
+        return self.directories * self.depth + 1
+
+    def target(self, level, i):
+        return f"build/l{level}/d{i % self.directories}/t{i}"
+
+    def source(self, i):
+        return f"src/d{i % self.directories}/t{i}.c"
+
+    def makefile(self):
+        rules = STYLES[self.style]
+        return MAKEFILE.format(
+            per_level=self.per_level,
+            fan_in=self.fan_in,
+            directories=self.directories,
+            depth=self.depth,
+            first_rule=rules["first"],
+            rule=rules["rest"],
+        )
+
+    def write(self, directory):
+        path = os.path.join(directory, "Makefile.py")
+        with open(path, "w") as f:
+            f.write(self.makefile())
+        return path
+
+    # Timestamps of the files of a clean checkout: only the sources exist
+    def clean_files(self):
+        return {self.source(i): 100 for i in range(self.per_level)}
+
+    # Timestamps of the files after a full build, with every target newer
+    # than its sources
+    def built_files(self):
+        files = self.clean_files()
+        for level in range(1, self.depth + 1):
+            for i in range(self.per_level):
+                files[self.target(level, i)] = 100 + level
+        return files
+
+
+# Keeps the timestamps of a project in memory, so the benchmarks measure
+# make.py instead of the file system
+class MemoryFileSystem:
+    def __init__(self, files):
+        self.files = files
+
+    def get_timestamp(self, path):
+        return self.files.get(path)
+
+    def invalidate(self, path):
+        pass
+
+    @staticmethod
+    def make_parents(path):
+        pass
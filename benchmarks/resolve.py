@@ -0,0 +1,92 @@
+# Measures how long Executor.resolve takes to build the job graph for
+# synthetic projects with a varying number of rules and targets.
+#
+# Usage: python benchmarks/resolve.py
+
+import sys
+import time
+from pathlib import Path
+from queue import Queue
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.project import MemoryFileSystem  # noqa: E402
+from make_py.executor import Executor, JobPool  # noqa: E402
+from make_py.matcher import (  # noqa: E402
+    PercentPatternMatcher,
+    PlainTextMatcher,
+    RegularExpressionMatcher,
+)
+from make_py.rule_index import RuleIndex  # noqa: E402
+from make_py.task import Task  # noqa: E402
+
+
+# The behaviour of Executor.resolve before rules were indexed
+class LinearRules:
+    def __init__(self, tasks):
+        self.tasks = tasks
+
+    def match(self, target):
+        for task in self.tasks:
+            ctx = task.matcher.match(target)
+            if ctx:
+                return task, ctx
+
+        return None, None
+
+
+def generate_project(n_rules, n_targets):
+    tasks = []
+    for i in range(n_rules):
+        tasks.append(
+            Task(
+                matcher=PercentPatternMatcher(
+                    target=f"build/dir{i}/%.o", sources=[f"src/dir{i}/%.c"]
+                ),
+                handler=None,
+            )
+        )
+
+    tasks.append(
+        Task(
+            matcher=RegularExpressionMatcher(target=r"(.*)\.txt", sources=[]),
+            handler=None,
+        )
+    )
+
+    objects = [f"build/dir{i % n_rules}/file{i}.o" for i in range(n_targets)]
+    tasks.append(
+        Task(
+            matcher=PlainTextMatcher(target="all", sources=objects),
+            handler=None,
+            phony=True,
+        )
+    )
+
+    files = {f"src/dir{i % n_rules}/file{i}.c": 100 for i in range(n_targets)}
+    return tasks, files
+
+
+def measure(rules, files):
+    executor = Executor(MemoryFileSystem(files), JobPool(), rules, silent=True)
+
+    start = time.perf_counter()
+    executor.resolve(Queue(), "all")
+    return time.perf_counter() - start
+
+
+def main():
+    print(f"{'rules':>8} {'targets':>8} {'linear (s)':>12} {'indexed (s)':>12}")
+
+    for n_rules in [10, 100, 500]:
+        for n_targets in [1000, 10000, 50000]:
+            tasks, files = generate_project(n_rules, n_targets)
+
+            linear = measure(LinearRules(tasks), files)
+            indexed = measure(RuleIndex(tasks), files)
+
+            print(f"{n_rules:>8} {n_targets:>8} {linear:>12.3f} {indexed:>12.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+# Measures the overhead of make.py itself on synthetic projects: loading the
+# Makefile, resolving the graph, a no-op build of an up to date project, a
+# full build with handlers that do nothing, and memory. Every case runs in a
+# fresh process, so peak memory is measured per case.
+#
+# Usage:
+#   python benchmarks/suite.py [--preset full] [-o results.json]
+#   python benchmarks/suite.py --compare old.json new.json
+
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from argparse import ArgumentParser
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from benchmarks.project import MemoryFileSystem, Project  # noqa: E402
+from make_py.executor import Executor, JobPool  # noqa: E402
+from make_py.rule_index import RuleIndex  # noqa: E402
+from make_py.session import load_script  # noqa: E402
+from make_py.task import TASKS  # noqa: E402
+
+# name: (targets, rules, fan in, depth, style)
+CASES = {
+    "percent-10k": (10_000, 12, 4, 3, "percent"),
+    "regex-10k": (10_000, 12, 4, 3, "regex"),
+    "many-rules-10k": (10_000, 600, 4, 3, "percent"),
+    "many-regex-rules-10k": (10_000, 150, 4, 3, "regex"),
+    "wide-100k": (100_000, 20, 16, 2, "percent"),
+    "deep-100k": (100_000, 20, 2, 20, "percent"),
+    "percent-300k": (300_000, 100, 4, 4, "percent"),
+    "percent-500k": (500_000, 100, 4, 4, "percent"),
+}
+
+PRESETS = {
+    "quick": ["percent-10k", "regex-10k", "many-rules-10k", "many-regex-rules-10k"],
+    "default": [name for name in CASES if not name.endswith(("300k", "500k"))],
+    "full": list(CASES),
+}
+
+# Seconds, lower is better
+TIMINGS = ["load", "resolve", "noop_build", "full_build", "scheduling"]
+# Bytes, lower is better
+MEMORY = ["graph_memory", "peak_rss"]
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return time.perf_counter() - start, result
+
+
+def load(path):
+    TASKS.clear()
+    load_script(path)
+    return RuleIndex(TASKS)
+
+
+def executor(rules, files, jobs):
+    return Executor(MemoryFileSystem(files), JobPool(), rules, silent=True, jobs=jobs)
+
+
+# Runs one case in this process and returns its measurements
+def run_case(name, jobs):
+    project = Project(*CASES[name])
+    result = {
+        "case": name,
+        "targets": project.targets,
+        "rules": project.rules,
+        "fan_in": project.fan_in,
+        "depth": project.depth,
+        "style": project.style,
+        "jobs": jobs,
+    }
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = project.write(directory)
+        result["load"], rules = timed(lambda: load(path))
+
+    clean = project.clean_files()
+    built = project.built_files()
+
+    result["resolve"], _ = timed(lambda: executor(rules, clean, jobs).prepare("all"))
+    result["noop_build"], _ = timed(lambda: executor(rules, built, jobs).execute("all"))
+    result["full_build"], _ = timed(lambda: executor(rules, clean, jobs).execute("all"))
+    result["scheduling"] = result["full_build"] - result["resolve"]
+
+    # Memory the resolved graph of a full build keeps alive
+    tracemalloc.start()
+    graph = executor(rules, clean, jobs)
+    graph.prepare("all")
+    result["graph_memory"] = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    # ru_maxrss is in kilobytes on Linux but in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    result["peak_rss"] = peak if sys.platform == "darwin" else peak * 1024
+    return result
+
+
+def git_commit():
+    try:
+        output = subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], cwd=ROOT, stderr=subprocess.DEVNULL
+        )
+        return output.decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_suite(names, jobs):
+    results = []
+    for name in names:
+        output = subprocess.check_output(
+            [sys.executable, __file__, "--case", name, "-j", str(jobs)]
+        )
+        result = json.loads(output)
+        print_result(result)
+        results.append(result)
+
+    return {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": results,
+    }
+
+
+def format_value(key, value):
+    if key in MEMORY:
+        return f"{value / (1 << 20):.1f} MiB"
+    return f"{value:.3f}s"
+
+
+def print_result(result):
+    print(f"{result['case']} ({result['targets']} targets, {result['rules']} rules)")
+    for key in TIMINGS + MEMORY:
+        print(f"  {key:<14} {format_value(key, result[key]):>12}")
+
+
+# Prints how every measurement changed from one results file to another
+def compare(old_path, new_path):
+    with open(old_path) as f:
+        old = {result["case"]: result for result in json.load(f)["results"]}
+    with open(new_path) as f:
+        new = json.load(f)["results"]
+
+    for result in new:
+        before = old.get(result["case"])
+        if before is None:
+            continue
+
+        print(result["case"])
+        for key in TIMINGS + MEMORY:
+            a, b = before[key], result[key]
+            change = (b - a) / a * 100 if a else 0.0
+            print(
+                f"  {key:<14} {format_value(key, a):>12} -> "
+                f"{format_value(key, b):>12} {change:+7.1f}%"
+            )
+
+
+def main():
+    arg_parser = ArgumentParser()
+    arg_parser.add_argument("--preset", choices=PRESETS, default="default")
+    arg_parser.add_argument("--cases", nargs="+", choices=CASES)
+    arg_parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1)
+    arg_parser.add_argument("-o", "--output")
+    arg_parser.add_argument("--case", choices=CASES)
+    arg_parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"))
+    args = arg_parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    # Run by run_suite in a child process
+    if args.case:
+        json.dump(run_case(args.case, args.jobs), sys.stdout)
+        return
+
+    results = run_suite(args.cases or PRESETS[args.preset], args.jobs)
+    output = args.output
+    if output is None:
+        commit = (results["commit"] or "unknown")[:12]
+        output = str(ROOT / "benchmarks" / "results" / f"{commit}.json")
+
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,6 @@
-from pathlib import Path
 from shutil import rmtree
-from subprocess import check_call
 
-from make_py import task, rule, phony_task
+from make_py import task, rule, phony_task, depfile
 
 CC = "gcc"
 OUTPUT = "build"
@@ -10,22 +8,16 @@ OUTPUT = "build"
 phony_task("all", f"{OUTPUT}/main")
 
 
-# Collect dependencies from .d files generated using `-MMD` option
-def collect_c_dependencies(target, args):
-    dep_file = Path(target).with_suffix(".d")
-    if dep_file.exists():
-        return dep_file.read_text().split(":")[1].strip().split(" ")
-
-
+# Dependencies are collected from the .d files generated using `-MMD` option.
 # Parent directories will be created automatically
-@rule(f"{OUTPUT}/%.o", ["%.c", collect_c_dependencies])
+@rule(f"{OUTPUT}/%.o", ["%.c", depfile()])
 def compile_c(ctx):
-    check_call([CC, "-MMD", "-c", ctx.source, "-o", ctx.target])
+    ctx.check_call([CC, "-MMD", "-c", ctx.source, "-o", ctx.target])
 
 
 @rule(f"{OUTPUT}/main", [f"{OUTPUT}/{o}" for o in ["hello.o", "main.o"]])
 def link(ctx):
-    check_call([CC, *ctx.sources, "-o", ctx.target])
+    ctx.check_call([CC, *ctx.sources, "-o", ctx.target])
 
 
 @task()
@@ -1,4 +1,13 @@
-from .task_gen import rule, task, phony_task
+from .task_gen import rule, task, phony_task, pool, source_inputs
 from .persistence import PersistentVariables
+from .depfile import depfile
 
-__all__ = ["rule", "task", "phony_task", "PersistentVariables"]
+__all__ = [
+    "rule",
+    "task",
+    "phony_task",
+    "pool",
+    "source_inputs",
+    "PersistentVariables",
+    "depfile",
+]
@@ -1,37 +1,82 @@
-import importlib.util
+import os
 import sys
 from argparse import ArgumentParser
 
-from .executor import Executor, JobPool
-from .filesystem import FileSystem
-from .task import TASKS
-from .persistence import STORAGE
+from . import daemon
+from .async_executor import ENGINES
+from .cache import DEFAULT_MAX_SIZE
+from .executor import BuildError
+from .fingerprint import FINGERPRINT_MODES
+from .history import History
+from .process_pool import EXECUTORS
+from .scheduler import SCHEDULES
+from .session import Session
+from .watch import WatchLoop
 
 
-def load_script(path):
-    sys.dont_write_bytecode = True
-    spec = importlib.util.spec_from_file_location("makefile", path)
-    makefile = importlib.util.module_from_spec(spec)
-    spec.loader.exec_module(makefile)
-
-
-def main():
+def create_arg_parser():
     arg_parser = ArgumentParser()
-    arg_parser.add_argument("-j", "--jobs", type=int, default=1)
+    arg_parser.add_argument("-j", "--jobs", type=int)
     arg_parser.add_argument("-f", "--file", default="Makefile.py")
+    arg_parser.add_argument("-k", "--keep-going", action="store_true")
+    arg_parser.add_argument("-l", "--load-average", type=float)
+    arg_parser.add_argument("--reserve-memory")
+    arg_parser.add_argument("--no-jobserver", action="store_true")
+    arg_parser.add_argument("--schedule", choices=SCHEDULES, default="critical-path")
+    arg_parser.add_argument("--fingerprint", choices=FINGERPRINT_MODES, default="mtime")
+    arg_parser.add_argument("--restat", action="store_true")
+    arg_parser.add_argument("--engine", choices=ENGINES, default="thread")
+    arg_parser.add_argument("--executor", choices=EXECUTORS, default="thread")
+    arg_parser.add_argument("--cache-dir")
+    arg_parser.add_argument("--cache-size", type=int, default=DEFAULT_MAX_SIZE)
+    arg_parser.add_argument("--cache-stats", action="store_true")
+    arg_parser.add_argument("--remote-cache")
+    arg_parser.add_argument("--serial-targets", action="store_true")
+    arg_parser.add_argument("--no-graph-cache", action="store_true")
+    arg_parser.add_argument("--trace")
+    arg_parser.add_argument("--stats", action="store_true")
+    arg_parser.add_argument("--profile-phases", action="store_true")
+    arg_parser.add_argument("--profile-output")
+    arg_parser.add_argument("--scan-directories", action="store_true")
+    arg_parser.add_argument("--watch", action="store_true")
+    arg_parser.add_argument("--watch-debounce", type=float, default=0.1)
+    arg_parser.add_argument("--daemon", action="store_true")
+    arg_parser.add_argument("--client", action="store_true")
+    arg_parser.add_argument("--stop-daemon", action="store_true")
+    arg_parser.add_argument("--socket", default=daemon.DEFAULT_SOCKET)
     arg_parser.add_argument("targets", nargs="*", default=["all"])
+    return arg_parser
+
+
+def main():
+    args = create_arg_parser().parse_args()
+
+    if args.stats:
+        print(History().summary())
+        return
+
+    if args.client or args.stop_daemon:
+        if args.stop_daemon:
+            message = {"shutdown": True}
+        else:
+            # Without -j the daemon uses the job limit it was started with
+            message = {"cwd": os.getcwd(), "targets": args.targets, "jobs": args.jobs}
 
-    args = arg_parser.parse_args()
-    load_script(args.file)
+        sys.exit(daemon.request(message, args.socket))
 
-    STORAGE.load()
+    session = Session(args)
     try:
-        for target in args.targets:
-            fs = FileSystem()
-            job_pool = JobPool()
-            Executor(fs, job_pool, TASKS, jobs=args.jobs).execute(target)
+        if args.daemon:
+            daemon.Daemon(session, args.socket).serve()
+        elif args.watch:
+            WatchLoop(session, args.targets, debounce=args.watch_debounce).run()
+        else:
+            session.build(args.targets)
+    except BuildError as e:
+        e.report()
+        sys.exit(1)
     finally:
-        STORAGE.dump()
+        session.close()
 
 
 if __name__ == "__main__":
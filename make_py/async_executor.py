@@ -0,0 +1,109 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .executor import BuildError, Executor
+from .task import reset_processes
+from .util import run_coroutine
+
+ENGINES = ["thread", "asyncio"]
+
+
+# Runs jobs on a single event loop instead of one thread per job slot.
+# Handlers defined with `async def` are awaited directly, plain handlers are
+# run in a thread pool of the same size as the job limit.
+class AsyncExecutor(Executor):
+    async def run_job_async(self, job, threads):
+        task, ctx = job.task, job.ctx
+        start = job.start = time.monotonic()
+        self.start_job(job)
+
+        loop = asyncio.get_event_loop()
+        key = self.cache_key(job)
+        if key is not None and self.cache.restore(key, self.outputs(job)):
+            job.cached = True
+        else:
+            if self.job_pool.cancelled:
+                return
+
+            if self.runs_in_process(task):
+                await loop.run_in_executor(threads, self.process_pool.run, task, ctx)
+            elif task.is_async:
+                await task.handler(ctx)
+            else:
+                await loop.run_in_executor(threads, task.run, ctx)
+
+            if key is not None:
+                self.cache.store(key, self.outputs(job))
+
+        self.finish_job(job, time.monotonic() - start)
+
+    async def run_with_token(self, job, threads):
+        loop = asyncio.get_event_loop()
+        token = await loop.run_in_executor(threads, self.jobserver.acquire)
+        try:
+            await self.run_job_async(job, threads)
+        finally:
+            self.jobserver.release(token)
+
+    async def run_and_finish(self, queue, job, threads, slots):
+        # Jobs are traced as running on one of `jobs` slots, as they all run
+        # on the same thread
+        slot = slots.pop()
+        if self.tracer is not None:
+            start = self.tracer.now()
+
+        try:
+            if not job.failed and self.should_run(job):
+                if self.jobserver is None:
+                    await self.run_job_async(job, threads)
+                else:
+                    await self.run_with_token(job, threads)
+        except Exception as e:
+            self.job_failed(job, e)
+        finally:
+            if self.tracer is not None:
+                self.trace_job(job, start, tid=slot)
+            slots.append(slot)
+            queue.task_done(job)
+            job.done()
+
+    async def run(self, queue, threads):
+        running = set()
+        slots = list(range(self.jobs, 0, -1))
+
+        while True:
+            while not self.job_pool.cancelled and len(running) < self.jobs:
+                job = queue.get_nowait()
+                if job is None:
+                    break
+
+                run = self.run_and_finish(queue, job, threads, slots)
+                running.add(asyncio.ensure_future(run))
+
+            if not running:
+                break
+
+            # Async handlers can be interrupted right away, handlers running
+            # in threads finish once their processes are terminated
+            if self.job_pool.cancelled:
+                for future in running:
+                    future.cancel()
+
+            _, running = await asyncio.wait(
+                running, return_when=asyncio.FIRST_COMPLETED
+            )
+
+    def execute(self, targets):
+        reset_processes()
+        queue = self.prepare(targets)
+        self.start_process_pool()
+
+        with ThreadPoolExecutor(max_workers=self.jobs) as threads:
+            try:
+                run_coroutine(self.run(queue, threads))
+            finally:
+                self.process_pool.shutdown()
+
+        if self.job_pool.failures:
+            raise BuildError(self.job_pool.failures)
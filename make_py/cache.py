@@ -0,0 +1,269 @@
+import hashlib
+import json
+import os
+import stat
+import struct
+import types
+from pathlib import Path
+from threading import Lock
+
+from .fingerprint import hash_file
+
+DEFAULT_MAX_SIZE = 1 << 30
+
+# Magic and number of outputs of an entry, then the permissions and size of
+# every output followed by its content
+ENTRY = struct.Struct("<8sI")
+ENTRY_MAGIC = b"MKPYOUT1"
+OUTPUT = struct.Struct("<IQ")
+
+
+# The parts of a code object that decide what it does. The file name and
+# line numbers are left out, so the same rule in another checkout, or moved
+# within its Makefile, keeps its cache entries.
+def code_identity(code):
+    digest = hashlib.sha256()
+    for part in [
+        code.co_code,
+        code.co_names,
+        code.co_varnames,
+        code.co_freevars,
+        code.co_cellvars,
+        (code.co_argcount, code.co_kwonlyargcount, code.co_flags),
+    ]:
+        digest.update(repr(part).encode())
+        digest.update(b"\0")
+
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            digest.update(code_identity(const))
+        elif isinstance(const, frozenset):
+            # Iteration order of sets changes with string hash randomization
+            digest.update(repr(sorted(map(repr, const))).encode())
+        else:
+            digest.update(repr(const).encode())
+        digest.update(b"\0")
+
+    return digest.digest()
+
+
+def handler_identity(handler):
+    name = "{}.{}".format(handler.__module__, handler.__qualname__)
+    code = getattr(handler, "__code__", None)
+    if code is None:
+        return name.encode()
+    return name.encode() + code_identity(code)
+
+
+def source_hash(path):
+    try:
+        return hash_file(path)
+    except OSError:
+        return None
+
+
+# Copies exactly `size` bytes, failing if the source ends early
+def copy_bytes(src, dst, size):
+    while size > 0:
+        chunk = src.read(min(size, 1 << 20))
+        if not chunk:
+            raise struct.error("Truncated cache entry")
+        dst.write(chunk)
+        size -= len(chunk)
+
+
+# Outputs of cacheable rules stored by a key computed from everything that
+# can influence them: the handler, the target, the content of the sources
+# and the environment variables and persistent variables the rule declares.
+#
+# Entries are files named after their key, holding every output of the rule
+# with its permissions: the target first, then the other declared outputs
+# in order. Their mtime is bumped on every hit, and the least recently used
+# ones are removed once the cache grows beyond `max_size` bytes. Entries
+# missing locally are looked up in the remote cache, if any, and new entries
+# are uploaded to it.
+class ActionCache:
+    def __init__(
+        self,
+        directory,
+        max_size=DEFAULT_MAX_SIZE,
+        file_hash=source_hash,
+        remote=None,
+    ):
+        self.directory = Path(directory)
+        self.max_size = max_size
+        self.file_hash = file_hash
+        self.remote = remote
+
+        self.lock = Lock()
+        self._size = None
+
+        self.hits = 0
+        self.misses = 0
+        self.bytes_restored = 0
+        self.bytes_stored = 0
+        self.evicted = 0
+
+    def key(self, task, ctx):
+        digest = hashlib.sha256()
+
+        def add(value):
+            digest.update(json.dumps(value, sort_keys=True).encode())
+            digest.update(b"\0")
+
+        digest.update(handler_identity(task.handler))
+        add(ctx.target)
+        add([[source, self.file_hash(source)] for source in ctx.sources])
+        add([[name, os.environ.get(name)] for name in task.cache_env])
+        add([variable.get_default(None) for variable in task.cache_vars])
+
+        return digest.hexdigest()
+
+    def entry(self, key):
+        return self.directory / key[:2] / key
+
+    # Entries being written are left out
+    def entries(self):
+        return [
+            path
+            for path in self.directory.glob("*/*")
+            if path.suffix != ".tmp" and path.is_file()
+        ]
+
+    def size(self):
+        if self._size is None:
+            self._size = sum(path.stat().st_size for path in self.entries())
+        return self._size
+
+    def prefetch(self, keys):
+        if self.remote is not None:
+            self.remote.prefetch(key for key in keys if not self.entry(key).exists())
+
+    # Restores all outputs of the entry, or none if it is missing or
+    # doesn't hold as many outputs as asked for
+    def restore(self, key, outputs):
+        entry = self.entry(key)
+        if not entry.exists():
+            if self.remote is None or not self.remote.fetch(key, entry):
+                with self.lock:
+                    self.misses += 1
+                return False
+
+        try:
+            os.utime(entry)
+            size = entry.stat().st_size
+            extracted = self.extract(entry, outputs)
+        except (OSError, struct.error):
+            extracted = None
+
+        if extracted is None:
+            with self.lock:
+                self.misses += 1
+            return False
+
+        for tmp, path in extracted:
+            os.replace(tmp, path)
+        with self.lock:
+            self.hits += 1
+            self.bytes_restored += size
+        return True
+
+    # Extracts the outputs next to where they belong, returning
+    # (temporary path, output) pairs
+    @staticmethod
+    def extract(entry, outputs):
+        extracted = []
+        try:
+            with open(entry, "rb") as f:
+                magic, n = ENTRY.unpack(f.read(ENTRY.size))
+                if magic != ENTRY_MAGIC or n != len(outputs):
+                    return None
+
+                for path in outputs:
+                    mode, size = OUTPUT.unpack(f.read(OUTPUT.size))
+                    path = str(path)
+                    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+                    tmp = "{}.{}.tmp".format(path, os.getpid())
+                    extracted.append((tmp, path))
+                    with open(tmp, "wb") as out:
+                        copy_bytes(f, out, size)
+                    os.chmod(tmp, mode)
+        except Exception:
+            for tmp, _ in extracted:
+                if os.path.exists(tmp):
+                    os.unlink(tmp)
+            raise
+
+        return extracted
+
+    def store(self, key, outputs):
+        if not all(os.path.isfile(path) for path in outputs):
+            return
+
+        # The size is counted before the entry is written, so it isn't
+        # counted twice
+        with self.lock:
+            self.size()
+
+        entry = self.entry(key)
+        entry.parent.mkdir(parents=True, exist_ok=True)
+        tmp = entry.with_name("{}.{}.tmp".format(key, os.getpid()))
+        with open(tmp, "wb") as f:
+            f.write(ENTRY.pack(ENTRY_MAGIC, len(outputs)))
+            for path in outputs:
+                with open(path, "rb") as output:
+                    st = os.fstat(output.fileno())
+                    f.write(OUTPUT.pack(stat.S_IMODE(st.st_mode), st.st_size))
+                    copy_bytes(output, f, st.st_size)
+
+        with self.lock:
+            try:
+                replaced = entry.stat().st_size
+            except FileNotFoundError:
+                replaced = 0
+            os.replace(tmp, entry)
+
+            size = entry.stat().st_size
+            self._size += size - replaced
+            self.bytes_stored += size
+
+        if self.remote is not None:
+            self.remote.upload(key, entry)
+
+        with self.lock:
+            if self._size > self.max_size:
+                self.evict()
+
+    def evict(self):
+        entries = []
+        for path in self.entries():
+            try:
+                st = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+
+        entries.sort()
+        self._size = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if self._size <= self.max_size:
+                break
+
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+            self._size -= size
+            self.evicted += 1
+
+    def stats(self):
+        return (
+            "Cache: {} hits, {} misses, {} bytes restored, {} bytes stored, "
+            "{} entries evicted".format(
+                self.hits,
+                self.misses,
+                self.bytes_restored,
+                self.bytes_stored,
+                self.evicted,
+            )
+        )
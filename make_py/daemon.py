@@ -0,0 +1,132 @@
+import json
+import os
+import socket
+import socketserver
+import sys
+import traceback
+from contextlib import redirect_stdout
+from threading import Lock
+
+from .executor import BuildError
+from .watcher import create_watcher
+
+DEFAULT_SOCKET = ".make_py/daemon.sock"
+
+
+# Sends everything printed during a build to the client as messages
+class ClientWriter:
+    def __init__(self, wfile):
+        self.wfile = wfile
+        self.lock = Lock()
+
+    def send(self, message):
+        with self.lock:
+            self.wfile.write(json.dumps(message).encode() + b"\n")
+            self.wfile.flush()
+
+    def write(self, text):
+        if text:
+            self.send({"output": text})
+        return len(text)
+
+    def flush(self):
+        pass
+
+
+# Serves builds from a session that stays alive between them.
+#
+# The loaded Makefile, the rule index, the stat cache and the resolved rules
+# and sources of the graph cache stay in memory, so a build only stats the
+# paths that changed and creates the jobs again. Every path seen while
+# resolving is watched, and changed paths are dropped from the stat cache
+# before the next build. A change of the Makefile reloads it.
+class Daemon:
+    def __init__(self, session, socket_path=DEFAULT_SOCKET):
+        self.session = session
+        self.socket_path = socket_path
+
+        self.watcher = create_watcher()
+        self.watcher.watch([session.args.file])
+        self.running = True
+
+    # Drops everything that changed from the caches
+    def refresh(self):
+        changed = self.watcher.wait(timeout=0)
+        if changed:
+            self.session.invalidate(changed)
+
+    def build(self, targets, jobs):
+        self.refresh()
+        self.session.build(targets, jobs)
+        self.watcher.watch(self.session.touched)
+
+        # Changes made by the build itself are only dropped from the caches
+        self.refresh()
+        return 0
+
+    def handle(self, request, writer):
+        if request.get("shutdown"):
+            self.running = False
+            return 0
+
+        if request.get("cwd") != os.getcwd():
+            writer.write("make.py daemon serves {}\n".format(os.getcwd()))
+            return 1
+
+        targets = tuple(request.get("targets") or ["all"])
+        try:
+            with redirect_stdout(writer):
+                return self.build(targets, request.get("jobs"))
+        except BuildError as e:
+            e.report(writer)
+            return 1
+        except Exception:
+            writer.write(traceback.format_exc())
+            return 1
+
+    def serve(self):
+        daemon = self
+
+        class RequestHandler(socketserver.StreamRequestHandler):
+            def handle(self):
+                writer = ClientWriter(self.wfile)
+                request = json.loads(self.rfile.readline())
+                writer.send({"status": daemon.handle(request, writer)})
+
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        os.makedirs(os.path.dirname(self.socket_path) or ".", exist_ok=True)
+
+        # Bound under another name and only moved in place once it listens,
+        # so clients never find a socket that refuses connections
+        path = "{}.{}.tmp".format(self.socket_path, os.getpid())
+        server = socketserver.UnixStreamServer(path, RequestHandler)
+        os.replace(path, self.socket_path)
+        try:
+            while self.running:
+                server.handle_request()
+        finally:
+            server.server_close()
+            os.unlink(self.socket_path)
+            self.watcher.close()
+
+
+# Sends a request to the daemon, prints its output and returns its status
+def request(message, socket_path=DEFAULT_SOCKET):
+    # Taken before connecting, as a daemon running in the same process
+    # redirects sys.stdout while it builds
+    out = sys.stdout
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(socket_path)
+        sock.sendall(json.dumps(message).encode() + b"\n")
+
+        with sock.makefile("rb") as f:
+            for line in f:
+                message = json.loads(line)
+                if "output" in message:
+                    out.write(message["output"])
+                    out.flush()
+                else:
+                    return message["status"]
+
+    return 1
@@ -0,0 +1,150 @@
+import os
+
+from .task_gen import source_inputs
+
+# Characters a backslash escapes in depfiles, anything else keeps the
+# backslash, e.g. in Windows paths
+_ESCAPED = " \t#"
+
+# path -> ((mtime_ns, size), parsed rules) of every depfile read so far
+_parsed = {}
+
+
+def ends_word(line, i):
+    return i == len(line) or line[i] in " \t:"
+
+
+# Splits one logical line into its targets and prerequisites. Returns None
+# for prerequisites if the line isn't a rule.
+def split_rule(line):
+    targets = []
+    prerequisites = None
+    words = targets
+    word = []
+
+    i, n = 0, len(line)
+    while i < n:
+        c = line[i]
+        if c == "\\" and i + 1 < n and line[i + 1] in _ESCAPED:
+            word.append(line[i + 1])
+            i += 2
+            continue
+
+        if c == "$" and i + 1 < n and line[i + 1] == "$":
+            word.append("$")
+            i += 2
+            continue
+
+        if c == "#":
+            break
+
+        if c in " \t":
+            if word:
+                words.append("".join(word))
+                word = []
+        elif c == ":" and prerequisites is None and ends_word(line, i + 1):
+            # A colon inside a word, as in "c:/src", doesn't end the targets
+            if word:
+                words.append("".join(word))
+                word = []
+            prerequisites = words = []
+            if i + 1 < n and line[i + 1] == ":":
+                i += 1
+        else:
+            word.append(c)
+
+        i += 1
+
+    if word:
+        words.append("".join(word))
+
+    return targets, prerequisites
+
+
+# Parses a Makefile-style depfile as written by `gcc -MD` and similar tools
+# into a dict of target -> prerequisites. Handles line continuations, escaped
+# spaces, several targets per rule and several rules per file.
+def parse_depfile(text):
+    rules = {}
+    text = text.replace("\\\r\n", " ").replace("\\\n", " ")
+
+    for line in text.splitlines():
+        targets, prerequisites = split_rule(line)
+        if prerequisites is None:
+            continue
+
+        prerequisites = [p for p in prerequisites if p != "|"]
+        for target in targets:
+            rules.setdefault(target, []).extend(prerequisites)
+
+    return rules
+
+
+# Returns the parsed rules of a depfile, or None if it doesn't exist. Files
+# are read in one go and parsed again only once their mtime or size changed.
+def read_depfile(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+
+    cached = _parsed.get(path)
+    if cached is not None and cached[0] == (st.st_mtime_ns, st.st_size):
+        return cached[1]
+
+    try:
+        with open(path, "rb") as f:
+            st = os.fstat(f.fileno())
+            text = f.read().decode(errors="surrogateescape")
+    except OSError:
+        return None
+
+    rules = parse_depfile(text)
+    _parsed[path] = ((st.st_mtime_ns, st.st_size), rules)
+    return rules
+
+
+def unique(items):
+    return list(dict.fromkeys(items))
+
+
+# A source reading the dependencies of a target from a depfile.
+#
+# `path` is a format string given the target regex groups, where `%` stands
+# for the first one, a function of (target, target_regex_groups), or None
+# for the target with its suffix replaced by ".d". The prerequisites of the
+# target are returned if the depfile lists it, those of every rule in the
+# file otherwise. A missing depfile adds no dependencies.
+def depfile(path=None):
+    if path is None:
+        name = "depfile()"
+
+        def depfile_path(target, args):
+            return os.path.splitext(target)[0] + ".d"
+
+    elif callable(path):
+        name = "depfile({})".format(path.__qualname__)
+
+        def depfile_path(target, args):
+            return str(path(target, args))
+
+    else:
+        name = "depfile({!r})".format(path)
+        template = path.replace("%", "{}")
+
+        def depfile_path(target, args):
+            return template.format(*args)
+
+    @source_inputs(lambda target, args: [depfile_path(target, args)])
+    def dependencies(target, args):
+        rules = read_depfile(depfile_path(target, args))
+        if not rules:
+            return None
+
+        prerequisites = rules.get(target)
+        if prerequisites is None:
+            prerequisites = [p for ps in rules.values() for p in ps]
+        return unique(prerequisites)
+
+    dependencies.__qualname__ = name
+    return dependencies
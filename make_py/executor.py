@@ -1,13 +1,55 @@
+import gc
 import sys
-from queue import Queue
-from threading import Thread, Lock
+import time
+import traceback
+from contextlib import contextmanager
+from threading import Condition, Thread, Lock
+
+from .graph_cache import NO_RULE, callable_inputs
+from .process_pool import ProcessPool
+from .rule_index import RuleIndex
+from .scheduler import ReadyQueue, assign_critical_path_priorities
+from .task import POOLS, Context, reset_processes, terminate_processes
+from .util import to_list
+
+
+# Raised once a build finished with failed jobs, listing every failure as a
+# (target, exception) pair
+class BuildError(Exception):
+    def __init__(self, failures):
+        self.failures = failures
+        targets = ", ".join(target for target, _ in failures)
+        super().__init__(f"Failed to make {targets}")
+
+    # Prints the traceback of every failure, then which targets failed
+    def report(self, file=None):
+        file = file or sys.stderr
+        for target, error in self.failures:
+            lines = traceback.format_exception(type(error), error, error.__traceback__)
+            file.write("".join(lines))
+            file.write(f"*** [{target}] Error\n")
+        file.write(f"*** {self}\n")
 
 
 class JobPool:
     def __init__(self):
         self.jobs = {}
+        # (timestamp, job) of every resolved target, including up to date
+        # targets and plain files which have no job
+        self.resolved = {}
         self.job_no_lock = Lock()
         self._next_job_no = 1
+        # Guards the pending dependency counts of jobs, which workers
+        # finishing at the same time would otherwise both decrement
+        self.dependency_lock = Lock()
+
+        # Number of created jobs that haven't finished yet. Workers keep
+        # waiting for jobs until it drops to zero or the build is cancelled.
+        self.state_changed = Condition()
+        self._unfinished = 0
+        self.cancelled = False
+        # (target, exception) of every job that failed
+        self.failures = []
 
     def get(self, target):
         return self.jobs.get(target)
@@ -15,8 +57,26 @@ class JobPool:
     def create(self, queue, target, task, ctx):
         job = Job(self, queue, target, task, ctx)
         self.jobs[target] = job
+        with self.state_changed:
+            self._unfinished += 1
         return job
 
+    def job_finished(self):
+        with self.state_changed:
+            self._unfinished -= 1
+            if self._unfinished == 0:
+                self.state_changed.notify_all()
+
+    def cancel(self):
+        with self.state_changed:
+            self.cancelled = True
+            self.state_changed.notify_all()
+
+    def wait(self):
+        with self.state_changed:
+            while self._unfinished > 0 and not self.cancelled:
+                self.state_changed.wait()
+
     def next_job_no(self):
         with self.job_no_lock:
             no = self._next_job_no
@@ -27,10 +87,30 @@ class JobPool:
         return len(self.jobs)
 
 
+# A target to build and its place in the graph. A build can have hundreds
+# of thousands of jobs, so they only keep a count of the dependencies that
+# haven't finished yet and the jobs depending on them.
 class Job:
-    all_jobs = {}
-    job_no_lock = Lock()
-    _next_job_no = 1
+    __slots__ = (
+        "queue",
+        "target",
+        "task",
+        "ctx",
+        "pending",
+        "depended_by",
+        "_job_no",
+        "priority",
+        "stale",
+        "timestamp",
+        "ran",
+        "failed",
+        "cached",
+        "start",
+        "duration",
+        "last_dependency",
+        "cache_key",
+        "pool",
+    )
 
     def __init__(self, pool, queue, target, task, ctx):
         self.queue = queue
@@ -38,25 +118,56 @@ class Job:
         self.task = task
         self.ctx = ctx
 
-        self.depends_on = {}
+        # Number of dependencies that haven't finished yet
+        self.pending = 0
         self.depended_by = []
         self._job_no = None
+        self.priority = 0
+
+        # Whether the job must run regardless of what its dependencies do,
+        # the timestamp of the target before the build, and whether the
+        # job actually ran once it was dequeued
+        self.stale = True
+        self.timestamp = 0
+        self.ran = False
+        # Whether the job or one of its dependencies failed, in which case
+        # it isn't run
+        self.failed = False
+        # Whether the target was restored from the action cache
+        self.cached = False
+        # When the job started running (time.monotonic) and how long it
+        # took, and the dependency that finished last before it could start
+        self.start = None
+        self.duration = 0.0
+        self.last_dependency = None
+
+        self.cache_key = None
 
         self.pool = pool
 
     def add_dependency(self, job):
-        id = len(self.depends_on)
-        self.depends_on[id] = job
-        job.depended_by.append((id, self))
+        self.pending += 1
+        job.depended_by.append(self)
 
     def done(self):
-        for id, dep in self.depended_by:
-            dep.dependency_done(id)
+        # Dependents must be enqueued before the job is counted as finished,
+        # otherwise the pool could look complete while they are still pending
+        ready = []
+        with self.pool.dependency_lock:
+            for dep in self.depended_by:
+                if self.failed:
+                    dep.failed = True
+                dep.last_dependency = self
+                dep.pending -= 1
+                if dep.pending == 0:
+                    ready.append(dep)
+
+        # Only the last dependency to finish sees the count drop to zero, so
+        # every dependent is enqueued exactly once
+        for dep in ready:
+            dep.queue.put(dep)
         self.depended_by = []
-
-    def dependency_done(self, id):
-        self.depends_on.pop(id, None)
-        self.try_enqueue()
+        self.pool.job_finished()
 
     def job_no(self):
         if self._job_no is None:
@@ -65,64 +176,266 @@ class Job:
         return self._job_no
 
     def try_enqueue(self):
-        if len(self.depends_on) > 0:
+        if self.pending > 0:
             return
 
-        self.queue.put((self, self.task, self.ctx))
+        self.queue.put(self)
+
+
+class ResolveFrame:
+    __slots__ = (
+        "target",
+        "timestamp",
+        "file_exists",
+        "task",
+        "ctx",
+        "next_source",
+        "newer_source",
+        "dependencies",
+    )
+
+    def __init__(self, target, timestamp, file_exists, task, ctx):
+        self.target = target
+        self.timestamp = timestamp
+        self.file_exists = file_exists
+        self.task = task
+        self.ctx = ctx
+
+        self.next_source = 0
+        self.newer_source = False
+        self.dependencies = []
 
 
 class Executor:
-    def __init__(self, fs, job_pool, tasks, jobs=1, silent=False):
+    def __init__(
+        self,
+        fs,
+        job_pool,
+        tasks,
+        jobs=1,
+        silent=False,
+        schedule="critical-path",
+        durations=None,
+        fingerprints=None,
+        restat=False,
+        executor="thread",
+        script=None,
+        cache=None,
+        graph=None,
+        limits=None,
+        pools=None,
+        jobserver=None,
+        keep_going=False,
+        tracer=None,
+    ):
         self.fs = fs
         self.job_pool = job_pool
 
-        self.tasks = tasks
+        # Either a list of tasks or an already built RuleIndex, so the index
+        # can be shared between executors
+        self.rules = RuleIndex(tasks) if isinstance(tasks, list) else tasks
         self.silent = silent
         self.jobs = jobs
 
-        self.cancelled = False
+        self.schedule = schedule
+        # Wall time of the last run of each target, in seconds
+        self.durations = durations if durations is not None else {}
+
+        # Content hashes of sources, or None to compare timestamps only
+        self.fingerprints = fingerprints
+        # Check whether the outputs of all rules actually changed before
+        # rebuilding their dependents, not just rules declared with restat
+        self.restat = restat
+
+        # Where handlers of tasks that don't choose themselves are run,
+        # either "thread" or "process"
+        self.executor = executor
+        self.process_pool = ProcessPool(self.rules.tasks, jobs, script=script)
+
+        self.cache = cache
+        # Rules and sources resolved by previous builds, see GraphCache
+        self.graph = graph
+        # Load and memory limits on starting jobs, see ResourceLimits
+        self.limits = limits
+        # Name -> depth of the pools tasks can be put in
+        self.pools = POOLS if pools is None else pools
+        # GNU make jobserver every job takes a token from, if any
+        self.jobserver = jobserver
+        # Keep building what doesn't depend on failed jobs, instead of
+        # cancelling the build on the first failure
+        self.keep_going = keep_going
+        # Records a Chrome trace of the build if set, see Tracer
+        self.tracer = tracer
 
     def resolve(self, queue, target):
-        job = self.job_pool.get(target)
-        if job:
-            return sys.maxsize, job
+        resolved = self.job_pool.resolved
+        result = resolved.get(target)
+        if result is not None:
+            return result
+
+        frame = self.enter(target)
+        if frame is None:
+            return resolved[target]
+
+        # Depth first traversal with an explicit stack, so deep dependency
+        # chains don't hit the recursion limit
+        stack = [frame]
+        visiting = {target}
+        while stack:
+            frame = stack[-1]
+            sources = frame.ctx.sources
+
+            child = None
+            while frame.next_source < len(sources):
+                source = sources[frame.next_source]
+
+                result = resolved.get(source)
+                if result is None:
+                    if source in visiting:
+                        raise Exception(
+                            "Dependency cycle: "
+                            + " -> ".join(self.cycle(stack, source))
+                        )
+
+                    child = self.enter(source)
+                    if child is not None:
+                        break
+
+                    result = resolved[source]
+
+                ts, job = result
+                if ts > frame.timestamp:
+                    frame.newer_source = True
+                if job:
+                    frame.dependencies.append(job)
+
+                frame.next_source += 1
 
+            if child is not None:
+                stack.append(child)
+                visiting.add(child.target)
+                continue
+
+            stack.pop()
+            visiting.discard(frame.target)
+            resolved[frame.target] = self.leave(queue, frame)
+
+        return resolved[target]
+
+    # Starts resolving a target. Returns a frame if its sources still need
+    # to be resolved, otherwise the result is stored in the job pool.
+    def enter(self, target):
         timestamp = self.fs.get_timestamp(target)
         file_exists = timestamp is not None
         if timestamp is None:
             timestamp = 0
 
-        for task in self.tasks:
-            ctx = task.matcher.match(target)
-            if not ctx:
-                continue
+        task, ctx = self.match(target)
+        if ctx:
+            return ResolveFrame(target, timestamp, file_exists, task, ctx)
 
-            should_run = False
+        if file_exists:
+            self.job_pool.resolved[target] = (timestamp, None)
+            return None
 
-            if len(ctx.sources) == 0:
-                should_run = True
+        raise Exception(f"No rules to make target '{target}'")
 
-            dependencies = []
-            for source in ctx.sources:
-                ts, job = self.resolve(queue, source)
-                if ts > timestamp:
-                    should_run = True
-                if job:
-                    dependencies.append(job)
+    # Finds the rule of a target, reusing what previous builds recorded
+    # instead of running the matchers and callable sources again
+    def match(self, target):
+        graph = self.graph
+        if graph is None:
+            return self.rules.match(target)
+
+        cached = graph.lookup(target)
+        if cached is not None:
+            position, sources = cached
+            if position == NO_RULE:
+                return None, None
+            return self.rules.tasks[position], Context(sources=sources, target=target)
+
+        position, ctx = self.rules.match_position(target)
+        if ctx is None:
+            graph.record(target, NO_RULE, [], [])
+            return None, None
+
+        task = self.rules.tasks[position]
+        inputs = callable_inputs(task.matcher, target)
+        if inputs is not None:
+            graph.record(target, position, ctx.sources, inputs)
+        return task, ctx
+
+    # Finishes resolving a target after all of its sources were resolved
+    def leave(self, queue, frame):
+        target, ctx, timestamp = frame.target, frame.ctx, frame.timestamp
+
+        stale = len(ctx.sources) == 0 or self.is_stale(
+            target, frame.file_exists, ctx.sources, frame.newer_source
+        )
+
+        # Whether a job with fresh sources runs is only known once its
+        # dependencies have run, see should_run()
+        if stale or len(frame.dependencies) > 0:
+            job = self.job_pool.create(queue, target, frame.task, ctx)
+            job.stale = stale
+            job.timestamp = timestamp
+            for dep in frame.dependencies:
+                job.add_dependency(dep)
+            return timestamp, job
+
+        return timestamp, None
+
+    @staticmethod
+    def cycle(stack, target):
+        targets = [frame.target for frame in stack]
+        return targets[targets.index(target) :] + [target]
+
+    def is_stale(self, target, file_exists, sources, newer_source):
+        if self.fingerprints is None:
+            return newer_source
+
+        if not file_exists:
+            return True
+
+        changed = self.fingerprints.changed(target, sources)
+        if changed is None:
+            # Nothing recorded yet, trust the timestamps this time and start
+            # tracking the target if it is up to date
+            if not newer_source:
+                self.fingerprints.record(target, sources)
+            return newer_source
+
+        return changed
+
+    def should_run(self, job):
+        if job.stale:
+            return True
+
+        dependency_ran = False
+        for source in job.ctx.sources:
+            dep = self.job_pool.get(source)
+            if dep is None or not dep.ran:
+                continue
 
-            if should_run:
-                job = self.job_pool.create(queue, target, task, ctx)
-                for dep in dependencies:
-                    job.add_dependency(dep)
-                job.try_enqueue()
-                return sys.maxsize, job
+            dependency_ran = True
+            if dep.task.phony:
+                return True
 
-            return timestamp, None
+            # Content hashes of all sources are compared below instead
+            if self.fingerprints is not None:
+                continue
 
-        if file_exists:
-            return timestamp, None
+            if not (self.restat or dep.task.restat):
+                return True
 
-        raise Exception(f"No rules to make target '{target}'")
+            ts = self.fs.get_timestamp(source)
+            if ts is None or ts > job.timestamp:
+                return True
+
+        if self.fingerprints is not None and dependency_ran:
+            return self.fingerprints.changed(job.target, job.ctx.sources) is not False
+
+        return False
 
     def print_task(self, task, ctx, i, n):
         if not self.silent:
@@ -146,32 +459,214 @@ class Executor:
                 )
             )
 
-    def worker(self, job_queue):
-        while not self.cancelled and not job_queue.empty():
-            job, task, ctx = job_queue.get()
-            self.print_task(task, ctx, job.job_no(), job.pool.total_job_no())
+    def start_job(self, job):
+        task, ctx = job.task, job.ctx
+        self.print_task(task, ctx, job.job_no(), job.pool.total_job_no())
 
-            try:
-                if not task.phony:
-                    self.fs.make_parents(ctx.target)
+        if not task.phony:
+            self.fs.make_parents(ctx.target)
 
-                task.run(ctx)
+    def runs_in_process(self, task):
+        return (task.executor or self.executor) == "process"
+
+    # Returns the action cache key of the job, or None if it isn't cached
+    def cache_key(self, job):
+        if self.cache is None or not job.task.cache or job.task.phony:
+            return None
+
+        if job.cache_key is None:
+            job.cache_key = self.cache.key(job.task, job.ctx)
+        return job.cache_key
+
+    # The target of the job and the other files its rule declares it writes
+    def outputs(self, job):
+        return [job.target] + job.task.matcher.outputs_of(job.target)
+
+    def run_job(self, job):
+        start = job.start = time.monotonic()
+        self.start_job(job)
+
+        key = self.cache_key(job)
+        if key is not None and self.cache.restore(key, self.outputs(job)):
+            job.cached = True
+        else:
+            # The build may have been cancelled while the job waited for its
+            # jobserver token or the cache
+            if self.job_pool.cancelled:
+                return
+
+            self.run_handler(job)
+
+            if key is not None:
+                self.cache.store(key, self.outputs(job))
+
+        self.finish_job(job, time.monotonic() - start)
+
+    def run_handler(self, job):
+        tracer = self.tracer
+        if tracer is not None:
+            start = tracer.now()
+
+        if self.runs_in_process(job.task):
+            self.process_pool.run(job.task, job.ctx)
+        else:
+            job.task.run(job.ctx)
+
+        if tracer is not None:
+            tracer.complete(job.task.handler.__name__, "handler", start)
+
+    def finish_job(self, job, duration):
+        task, ctx = job.task, job.ctx
+        self.durations[ctx.target] = duration
+        job.duration = duration
+
+        job.ran = True
+        if not task.phony:
+            for path in self.outputs(job):
+                self.fs.invalidate(path)
+
+        if self.fingerprints is not None:
+            self.fingerprints.record(ctx.target, ctx.sources)
+
+    # Holds a jobserver token while the job runs
+    @contextmanager
+    def job_token(self):
+        if self.jobserver is None:
+            yield
+            return
+
+        token = self.jobserver.acquire()
+        try:
+            yield
+        finally:
+            self.jobserver.release(token)
+
+    def job_failed(self, job, error):
+        job.failed = True
+        if job.start is not None:
+            job.duration = time.monotonic() - job.start
+
+        pool = self.job_pool
+        # Jobs failing after the build was cancelled were most likely
+        # terminated by it
+        if pool.cancelled:
+            return
+
+        pool.failures.append((job.target, error))
+        if not self.keep_going:
+            pool.cancel()
+            terminate_processes()
+
+    def worker(self, job_queue, worker_id=1):
+        tracer = self.tracer
+        if tracer is not None:
+            tracer.set_thread(worker_id, f"worker {worker_id}")
+
+        while True:
+            job = job_queue.get()
+            if job is None:
+                break
+            if self.job_pool.cancelled:
+                job_queue.task_done(job)
+                break
+
+            if tracer is not None:
+                start = tracer.now()
+
+            try:
+                if not job.failed and self.should_run(job):
+                    with self.job_token():
+                        self.run_job(job)
             except Exception as e:
-                self.cancelled = True
-                raise e
+                self.job_failed(job, e)
             finally:
+                if tracer is not None:
+                    self.trace_job(job, start)
+                job_queue.task_done(job)
                 job.done()
-                job_queue.task_done()
 
-    def execute(self, target):
-        queue = Queue()
-        self.resolve(queue, target)
+    def trace_job(self, job, start, tid=None):
+        self.tracer.complete(
+            job.target,
+            "job",
+            start,
+            tid=tid,
+            rule=job.task.handler.__name__,
+            ran=job.ran,
+            failed=job.failed,
+            cached=job.cached,
+        )
+
+    # Resolves all targets into one graph, so they share jobs and the job
+    # limit, and returns the queue the jobs become ready in
+    def prepare(self, targets):
+        queue = ReadyQueue(self.limits, self.pools)
+        tracer = self.tracer
+        if tracer is not None:
+            start = tracer.now()
+
+        # Everything allocated while resolving lives until the build ends,
+        # so collecting garbage cycles in the meantime only costs time
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            for target in to_list(targets):
+                self.resolve(queue, target)
+        finally:
+            if gc_enabled:
+                gc.enable()
+
+        if tracer is not None:
+            jobs = len(self.job_pool.jobs)
+            tracer.complete("resolve", "resolve", start, jobs=jobs, **tracer.totals())
+
+        jobs = self.job_pool.jobs.values()
+        for job in jobs:
+            if job.task.pool is not None and job.task.pool not in self.pools:
+                raise Exception(f"Unknown pool '{job.task.pool}'")
+
+        if self.schedule == "critical-path":
+            assign_critical_path_priorities(jobs, self.durations)
+
+        for job in list(jobs):
+            job.try_enqueue()
+
+        # The sources of jobs without dependencies won't change during the
+        # build, so whether the remote cache has their outputs can be
+        # checked in one batch up front
+        if self.cache is not None and self.cache.remote is not None:
+            keys = [self.cache_key(job) for job in jobs if job.pending == 0]
+            self.cache.prefetch(key for key in keys if key is not None)
+
+        return queue
+
+    # Starts the process pool up front if any job may run in it, see
+    # ProcessPool.start
+    def start_process_pool(self):
+        if any(self.runs_in_process(job.task) for job in self.job_pool.jobs.values()):
+            self.process_pool.start()
+
+    def execute(self, targets):
+        reset_processes()
+        queue = self.prepare(targets)
+        self.start_process_pool()
+
+        threads = [
+            Thread(target=self.worker, args=(queue, i + 1)) for i in range(self.jobs)
+        ]
 
-        threads = [Thread(target=self.worker, args=(queue,)) for _ in range(self.jobs)]
-
-        self.cancelled = False
         for t in threads:
             t.start()
 
+        # Jobs become ready as their dependencies finish, so the workers are
+        # only told to stop once the whole graph is done or cancelled
+        self.job_pool.wait()
+        queue.close()
+
         for t in threads:
             t.join()
+
+        self.process_pool.shutdown()
+
+        if self.job_pool.failures:
+            raise BuildError(self.job_pool.failures)
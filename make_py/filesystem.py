@@ -1,22 +1,84 @@
+import os
 from pathlib import Path
 
+# Marks paths whose timestamp isn't cached, since None is cached for
+# missing files
+_UNKNOWN = object()
+
 
 class FileSystem:
-    def __init__(self):
+    def __init__(self, scan_directories=False):
+        # Timestamps of looked up paths, None for paths that don't exist
         self.cache = {}
 
+        # With `scan_directories`, every directory is listed once with
+        # os.scandir and paths missing from the listing are known not to
+        # exist without a stat call. Paths in the listing are still stat'ed
+        # for their timestamp, so this only saves the lookups of missing
+        # paths, e.g. the targets of a clean build, and costs a listing per
+        # directory otherwise. Paths invalidated after the listing was made
+        # are always stat'ed.
+        self.scan_directories = scan_directories
+        self.listings = {}
+        self.unlisted = set()
+
     def get_timestamp(self, path):
-        time = self.cache.get(path)
-        if time is not None:
+        time = self.cache.get(path, _UNKNOWN)
+        if time is not _UNKNOWN:
             return time
 
+        if self.scan_directories and path not in self.unlisted:
+            time = self.scan(path)
+        else:
+            time = self.stat(path)
+
+        self.cache[path] = time
+        return time
+
+    @staticmethod
+    def stat(path):
         try:
-            time = Path(path).stat().st_mtime
-            self.cache[path] = time
-            return time
+            return Path(path).stat().st_mtime
         except Exception:
             return None
 
+    # Names of the entries of a directory
+    def listing(self, directory):
+        names = self.listings.get(directory)
+        if names is None:
+            try:
+                with os.scandir(directory or ".") as it:
+                    names = {entry.name for entry in it}
+            except OSError:
+                names = set()
+            self.listings[directory] = names
+
+        return names
+
+    def scan(self, path):
+        directory, name = os.path.split(path)
+        if name and name not in self.listing(directory):
+            return None
+
+        return self.stat(path)
+
+    # Forgets what is known about a path, e.g. after a job wrote it
+    def invalidate(self, path):
+        self.cache.pop(path, None)
+        self.listings.pop(path, None)
+
+        if self.scan_directories:
+            directory, name = os.path.split(path)
+            names = self.listings.get(directory)
+            if names is not None:
+                names.discard(name)
+            self.unlisted.add(path)
+
+    def clear(self):
+        self.cache.clear()
+        self.listings.clear()
+        self.unlisted.clear()
+
     @staticmethod
     def make_parents(path):
         Path(path).parent.mkdir(parents=True, exist_ok=True)
@@ -0,0 +1,69 @@
+import hashlib
+import os
+import stat
+
+from .persistence import STORAGE
+
+FINGERPRINT_MODES = ["mtime", "hash"]
+
+CHUNK_SIZE = 1 << 16
+
+
+def hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+# Content hashes of the sources each target was last built from.
+#
+# Hashes of files are cached together with their mtime and size, and a file
+# is only read again when one of them changes. Everything is kept in a
+# single storage file that is loaded and dumped together with the other
+# persistent variables.
+class Fingerprints:
+    def __init__(self, path=".make_py/fingerprints.json"):
+        self.path, self.storage = STORAGE.get_storage(path)
+
+    @property
+    def files(self):
+        return self.storage.setdefault("files", {})
+
+    @property
+    def targets(self):
+        return self.storage.setdefault("targets", {})
+
+    def file_hash(self, path):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+
+        if not stat.S_ISREG(st.st_mode):
+            return None
+
+        cached = self.files.get(path)
+        if cached and cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+            return cached[2]
+
+        digest = hash_file(path)
+        self.files[path] = [st.st_mtime_ns, st.st_size, digest]
+        return digest
+
+    def sources_hashes(self, sources):
+        return {source: self.file_hash(source) for source in sources}
+
+    # Returns whether the sources of `target` changed since it was recorded,
+    # or None if nothing has been recorded for it yet
+    def changed(self, target, sources):
+        recorded = self.targets.get(target)
+        if recorded is None:
+            return None
+
+        return recorded != self.sources_hashes(sources)
+
+    def record(self, target, sources):
+        self.targets[target] = self.sources_hashes(sources)
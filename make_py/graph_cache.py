@@ -0,0 +1,227 @@
+import hashlib
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+from .cache import handler_identity
+
+MAGIC = b"MKPYGRF1"
+
+# Magic, rule signature, number of strings and number of records
+HEADER = struct.Struct("<8s16sII")
+# Target, rule position (-1 for files without a rule) and the number of
+# sources and inputs that follow
+RECORD = struct.Struct("<IiII")
+INPUT = struct.Struct("<Id")
+
+NO_RULE = -1
+# Stored for inputs that didn't exist
+MISSING = -1.0
+
+
+# Identifies the rules of a Makefile. The Makefile itself is hashed too,
+# since callable sources may read globals or closure values that the code
+# of the callables doesn't show.
+def rules_signature(tasks, script=None):
+    digest = hashlib.blake2b(digest_size=16)
+    if script is not None:
+        with open(script, "rb") as f:
+            digest.update(f.read())
+        digest.update(b"\0")
+
+    for task in tasks:
+        matcher = task.matcher
+        digest.update(matcher.target_re.pattern.encode())
+        for source in matcher.sources:
+            digest.update(b"\0")
+            if callable(source):
+                digest.update(handler_identity(source))
+                inputs = getattr(source, "inputs", None)
+                if inputs is not None:
+                    digest.update(handler_identity(inputs))
+            else:
+                digest.update(str(source).encode())
+        digest.update(b"\n")
+    return digest.digest()
+
+
+# Files a callable source reads, declared by `source_inputs`. Returns None
+# if one of the callable sources of the matcher doesn't declare them.
+def callable_inputs(matcher, target):
+    callables = [source for source in matcher.sources if callable(source)]
+    if not callables:
+        return []
+
+    args = matcher.target_re.fullmatch(target).groups()
+    inputs = []
+    for source in callables:
+        declared = getattr(source, "inputs", None)
+        if declared is None:
+            return None
+        inputs.extend(str(path) for path in declared(target, args))
+
+    return inputs
+
+
+# The resolved rule and sources of every target of the previous builds,
+# saved in a compact binary file:
+#
+#   header | string offsets (uint32) | strings (utf-8) | records
+#
+# where every record is a RECORD followed by its sources as string ids and
+# its inputs as (string id, timestamp) pairs. The file is memory-mapped on
+# load and only the targets are decoded up front; sources are decoded when a
+# target is looked up.
+#
+# A record is reused while the timestamps of the inputs of its callable
+# sources stay the same. Targets matched by callable sources that don't
+# declare their inputs are never recorded, and the whole file is discarded
+# when the rules or the Makefile `script` change.
+class GraphCache:
+    def __init__(self, path, tasks, fs, script=None):
+        self.path = path
+        self.signature = rules_signature(tasks, script)
+        self.fs = fs
+
+        # target -> (position, sources, [(input, timestamp)]) for records made
+        # by this session
+        self.records = {}
+        # target -> offset of its record in the loaded file
+        self.offsets = {}
+        self.data = None
+        self.strings = None
+        self.base = 0
+        self.dirty = False
+
+        self.hits = 0
+        self.misses = 0
+
+    def load(self):
+        try:
+            with open(self.path, "rb") as f:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return
+
+        if len(data) < HEADER.size:
+            return
+        magic, signature, n_strings, n_records = HEADER.unpack_from(data, 0)
+        if magic != MAGIC or signature != self.signature:
+            self.dirty = True
+            return
+
+        offset = HEADER.size
+        strings = array("I")
+        strings.frombytes(data[offset : offset + 4 * (n_strings + 1)])
+        self.data, self.strings = data, strings
+        self.base = offset + 4 * (n_strings + 1)
+
+        offset = self.base + strings[-1]
+        for _ in range(n_records):
+            target, _, n_sources, n_inputs = RECORD.unpack_from(data, offset)
+            self.offsets[self.string(target)] = offset
+            offset += RECORD.size + 4 * n_sources + INPUT.size * n_inputs
+
+    def string(self, i):
+        start = self.base + self.strings[i]
+        end = self.base + self.strings[i + 1]
+        return sys.intern(self.data[start:end].decode())
+
+    def decode(self, offset):
+        data = self.data
+        _, position, n_sources, n_inputs = RECORD.unpack_from(data, offset)
+        offset += RECORD.size
+
+        ids = struct.unpack_from("<{}I".format(n_sources), data, offset)
+        sources = [self.string(i) for i in ids]
+        offset += 4 * n_sources
+
+        inputs = []
+        for _ in range(n_inputs):
+            i, timestamp = INPUT.unpack_from(data, offset)
+            inputs.append((self.string(i), timestamp))
+            offset += INPUT.size
+
+        return position, sources, inputs
+
+    def timestamp(self, path):
+        timestamp = self.fs.get_timestamp(path)
+        return MISSING if timestamp is None else timestamp
+
+    # Returns the rule position and sources recorded for a target, or None if
+    # there is no record or the inputs of its callable sources changed
+    def lookup(self, target):
+        record = self.records.get(target)
+        if record is None:
+            offset = self.offsets.get(target)
+            if offset is not None:
+                record = self.records[target] = self.decode(offset)
+
+        if record is not None:
+            position, sources, inputs = record
+            if all(self.timestamp(path) == stamp for path, stamp in inputs):
+                self.hits += 1
+                return position, sources
+
+        self.misses += 1
+        return None
+
+    def record(self, target, position, sources, inputs):
+        self.records[target] = (
+            position,
+            sources,
+            [(path, self.timestamp(path)) for path in inputs],
+        )
+        self.dirty = True
+
+    def dump(self):
+        if not self.dirty:
+            return
+
+        for target, offset in self.offsets.items():
+            if target not in self.records:
+                self.records[target] = self.decode(offset)
+
+        ids = {}
+        blob = bytearray()
+        offsets = array("I", [0])
+
+        def intern(s):
+            i = ids.get(s)
+            if i is None:
+                i = ids[s] = len(ids)
+                blob.extend(s.encode())
+                offsets.append(len(blob))
+            return i
+
+        records = bytearray()
+        for target, (position, sources, inputs) in self.records.items():
+            records += RECORD.pack(intern(target), position, len(sources), len(inputs))
+            records += array("I", [intern(source) for source in sources]).tobytes()
+            for path, timestamp in inputs:
+                records += INPUT.pack(intern(path), timestamp)
+
+        header = HEADER.pack(MAGIC, self.signature, len(ids), len(self.records))
+
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = "{}.{}.tmp".format(self.path, os.getpid())
+        with open(tmp, "wb") as f:
+            f.write(header)
+            f.write(offsets.tobytes())
+            f.write(blob)
+            f.write(records)
+        os.replace(tmp, self.path)
+
+        self.close()
+        self.offsets.clear()
+        self.dirty = False
+
+    def close(self):
+        if self.data is not None:
+            self.data.close()
+            self.data = None
+
+    def stats(self):
+        return "Graph cache: {} hits, {} misses".format(self.hits, self.misses)
@@ -0,0 +1,331 @@
+import os
+import struct
+import time
+from array import array
+
+DEFAULT_PATH = ".make_py/history.bin"
+DEFAULT_MAX_SIZE = 16 << 20
+
+# Magic, build id, start time (seconds since the epoch), wall time, job
+# limit, number of records and the size of the two string blobs. A job limit
+# of 0 marks the block compaction folds old builds into.
+BLOCK = struct.Struct("<4sIdfIIII")
+MAGIC = b"BLD1"
+
+STATUS_OK = 0
+STATUS_FAILED = 1
+
+CACHE_NONE = 0
+CACHE_MISS = 1
+CACHE_HIT = 2
+
+
+class JobRecord:
+    __slots__ = ("target", "rule", "start", "duration", "status", "cache", "critical")
+
+    def __init__(self, target, rule, start, duration, status, cache, critical):
+        self.target = target
+        self.rule = rule
+        # Seconds since the start of the build
+        self.start = start
+        self.duration = duration
+        self.status = status
+        self.cache = cache
+        self.critical = critical
+
+    @property
+    def end(self):
+        return self.start + self.duration
+
+
+class Build:
+    def __init__(self, id, start, wall, jobs, records):
+        self.id = id
+        self.start = start
+        self.wall = wall
+        self.jobs = jobs
+        self.records = records
+
+    # Average number of jobs running at once
+    @property
+    def parallelism(self):
+        busy = sum(record.duration for record in self.records)
+        return busy / self.wall if self.wall > 0 else 0.0
+
+    @property
+    def critical_path(self):
+        path = [record for record in self.records if record.critical]
+        path.sort(key=lambda record: record.start)
+        return path
+
+    def encode(self):
+        records = self.records
+        targets = "\0".join(record.target for record in records).encode()
+        rules = "\0".join(record.rule for record in records).encode()
+
+        header = BLOCK.pack(
+            MAGIC,
+            self.id,
+            self.start,
+            self.wall,
+            self.jobs,
+            len(records),
+            len(targets),
+            len(rules),
+        )
+        return b"".join(
+            [
+                header,
+                array("f", [record.start for record in records]).tobytes(),
+                array("f", [record.duration for record in records]).tobytes(),
+                bytes(record.status for record in records),
+                bytes(record.cache for record in records),
+                bytes(record.critical for record in records),
+                targets,
+                rules,
+            ]
+        )
+
+
+# Decodes the block at `offset`. Returns the columns of the block and the
+# offset of the next one, or None if the data ends or is corrupt.
+def decode_block(data, offset):
+    if len(data) - offset < BLOCK.size:
+        return None
+
+    header = BLOCK.unpack_from(data, offset)
+    magic, id, start, wall, jobs, n, targets_size, rules_size = header
+    end = offset + BLOCK.size + 11 * n + targets_size + rules_size
+    if magic != MAGIC or end > len(data):
+        return None
+
+    offset += BLOCK.size
+    starts = array("f", data[offset : offset + 4 * n])
+    offset += 4 * n
+    durations = array("f", data[offset : offset + 4 * n])
+    offset += 4 * n
+    statuses = data[offset : offset + n]
+    caches = data[offset + n : offset + 2 * n]
+    critical = data[offset + 2 * n : offset + 3 * n]
+    offset += 3 * n
+
+    targets = data[offset : offset + targets_size].decode().split("\0") if n else []
+    offset += targets_size
+    rules = data[offset : offset + rules_size].decode().split("\0") if n else []
+
+    columns = (id, start, wall, jobs, starts, durations, statuses, caches, critical)
+    return columns, targets, rules, end
+
+
+# Wall time, exit status and cache outcome of every job of the last builds,
+# appended to a compact binary log after every build.
+#
+# Every build is one block: a header followed by its records column by
+# column, so the durations of a build are loaded with a few array copies.
+# Once the log grows beyond `max_size` bytes, it is rewritten with the newest
+# builds taking up at most half of that, and the durations of targets only
+# found in dropped builds folded into a single block.
+class History:
+    def __init__(self, path=DEFAULT_PATH, max_size=DEFAULT_MAX_SIZE):
+        self.path = path
+        self.max_size = max_size
+        self._durations = None
+        self._last_id = None
+
+    def read(self):
+        try:
+            with open(self.path, "rb") as f:
+                return f.read()
+        except OSError:
+            return b""
+
+    def blocks(self, data=None):
+        data = self.read() if data is None else data
+        offset = 0
+        while True:
+            block = decode_block(data, offset)
+            if block is None:
+                return
+
+            yield block[:3]
+            offset = block[3]
+
+    # Every recorded build, oldest first
+    def builds(self):
+        builds = []
+        for columns, targets, rules in self.blocks():
+            id, start, wall, jobs = columns[:4]
+            if jobs == 0:
+                continue
+
+            records = [
+                JobRecord(*fields) for fields in zip(targets, rules, *columns[4:])
+            ]
+            builds.append(Build(id, start, wall, jobs, records))
+
+        return builds
+
+    def last_build(self):
+        builds = self.builds()
+        return builds[-1] if builds else None
+
+    # Wall time of the last run of every target, in seconds. The dict is
+    # loaded once and kept up to date by `record`, so the scheduler can
+    # keep using it.
+    def durations(self):
+        if self._durations is None:
+            self._durations = {}
+            self._last_id = 0
+            for columns, targets, _ in self.blocks():
+                self._durations.update(zip(targets, columns[5]))
+                self._last_id = max(self._last_id, columns[0])
+
+        return self._durations
+
+    def next_id(self):
+        if self._last_id is None:
+            self.durations()
+        self._last_id += 1
+        return self._last_id
+
+    # Appends a build of the given jobs, which ran between the monotonic
+    # times `start` and `end` with a limit of `jobs_limit` jobs at once
+    def record(self, jobs, jobs_limit, start, end):
+        ran = [job for job in jobs if job.start is not None]
+        if not ran:
+            return
+
+        critical = critical_jobs(ran)
+        records = [
+            JobRecord(
+                job.target,
+                job.task.handler.__name__,
+                job.start - start,
+                job.duration,
+                STATUS_FAILED if job.failed else STATUS_OK,
+                cache_outcome(job),
+                job in critical,
+            )
+            for job in ran
+        ]
+
+        wall = end - start
+        build = Build(self.next_id(), time.time() - wall, wall, jobs_limit, records)
+        self.durations().update((r.target, r.duration) for r in records)
+
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "ab") as f:
+            f.write(build.encode())
+            size = f.tell()
+
+        if size > self.max_size:
+            self.compact()
+
+    def compact(self):
+        data = self.read()
+        blocks = []
+        offset = 0
+        while True:
+            block = decode_block(data, offset)
+            if block is None:
+                break
+            blocks.append((offset, block[3]))
+            offset = block[3]
+
+        if not blocks:
+            return
+
+        # The newest builds that fit into half of the limit, at least one
+        keep = len(blocks) - 1
+        size = blocks[keep][1] - blocks[keep][0]
+        while keep > 0:
+            block_size = blocks[keep - 1][1] - blocks[keep - 1][0]
+            if size + block_size > self.max_size // 2:
+                break
+            keep -= 1
+            size += block_size
+
+        kept = data[blocks[keep][0] :]
+        kept_targets = set()
+        for _, targets, _ in self.blocks(kept):
+            kept_targets.update(targets)
+
+        folded = {}
+        for columns, targets, rules in self.blocks(data[: blocks[keep][0]]):
+            for target, rule, duration in zip(targets, rules, columns[5]):
+                if target not in kept_targets:
+                    folded[target] = (rule, duration)
+
+        records = [
+            JobRecord(target, rule, 0.0, duration, STATUS_OK, CACHE_NONE, False)
+            for target, (rule, duration) in folded.items()
+        ]
+
+        tmp = "{}.{}.tmp".format(self.path, os.getpid())
+        with open(tmp, "wb") as f:
+            if records:
+                f.write(Build(0, 0.0, 0.0, 0, records).encode())
+            f.write(kept)
+        os.replace(tmp, self.path)
+
+    def summary(self, count=10):
+        builds = self.builds()
+        if not builds:
+            return "No builds recorded"
+
+        last = builds[-1]
+        lines = []
+
+        rules = {}
+        for build in builds:
+            for record in build.records:
+                total, runs = rules.get(record.rule, (0.0, 0))
+                rules[record.rule] = (total + record.duration, runs + 1)
+
+        lines.append(f"Slowest rules over {len(builds)} builds (total, runs, average):")
+        slowest = sorted(rules.items(), key=lambda item: -item[1][0])[:count]
+        for rule, (total, runs) in slowest:
+            lines.append(f"  {total:10.3f}s {runs:6} {total / runs:10.3f}s  {rule}")
+
+        lines.append("Slowest targets of the last build:")
+        slowest = sorted(last.records, key=lambda record: -record.duration)[:count]
+        for record in slowest:
+            lines.append(f"  {record.duration:10.3f}s  {record.target}")
+
+        failed = sum(record.status == STATUS_FAILED for record in last.records)
+        hits = sum(record.cache == CACHE_HIT for record in last.records)
+        lines.append(
+            f"Last build: {len(last.records)} jobs, {failed} failed, "
+            f"{hits} restored from cache, {last.wall:.3f}s"
+        )
+        lines.append(f"Parallelism: {last.parallelism:.2f} of -j {last.jobs}")
+
+        path = last.critical_path
+        length = sum(record.duration for record in path)
+        lines.append(f"Critical path ({length:.3f}s):")
+        for record in path:
+            lines.append(f"  {record.duration:10.3f}s  {record.target}")
+
+        return "\n".join(lines)
+
+
+def cache_outcome(job):
+    if job.cached:
+        return CACHE_HIT
+    if job.task.cache:
+        return CACHE_MISS
+    return CACHE_NONE
+
+
+# The chain of jobs that determined when the build finished: the job that
+# finished last, the dependency that finished last before it started, and so
+# on
+def critical_jobs(jobs):
+    job = max(jobs, key=lambda job: job.start + job.duration)
+    chain = set()
+    while job is not None and job not in chain:
+        if job.start is not None:
+            chain.add(job)
+        job = job.last_dependency
+
+    return chain
@@ -0,0 +1,142 @@
+import os
+import re
+import select
+from threading import Lock
+
+AUTH_RE = re.compile(r"--jobserver-(?:auth|fds)=(\S+)")
+JOBS_RE = re.compile(r"(?:^|\s)-j ?(\d+)")
+
+TOKEN = b"+"
+
+
+# Returns the jobserver argument of a MAKEFLAGS value, or None
+def jobserver_auth(makeflags):
+    # Only the last one counts if there are several
+    found = AUTH_RE.findall(makeflags or "")
+    return found[-1] if found else None
+
+
+# Returns the job limit of a MAKEFLAGS value, or None
+def makeflags_jobs(makeflags):
+    found = JOBS_RE.findall(makeflags or "")
+    return int(found[-1]) if found else None
+
+
+# A GNU make jobserver: a pipe or fifo holding one token per job that may
+# run besides the first one. Every process sharing it reads a token before
+# starting a job and writes it back once the job is done, so nested builds
+# share one job limit.
+#
+# Every process gets one implicit token for free, used here by whichever job
+# starts while no other job of this build is running.
+class JobServerClient:
+    def __init__(self, read_fd, write_fd):
+        self.read_fd = read_fd
+        self.write_fd = write_fd
+
+        self.lock = Lock()
+        self.implicit_used = False
+
+    # Connects to the jobserver described by a MAKEFLAGS value. Returns None
+    # if there is none or it can't be used, e.g. because the parent make
+    # didn't pass its pipe on to us.
+    @classmethod
+    def connect(cls, makeflags):
+        auth = jobserver_auth(makeflags)
+        if auth is None:
+            return None
+
+        try:
+            if auth.startswith("fifo:"):
+                fd = os.open(auth[len("fifo:") :], os.O_RDWR)
+                return cls(fd, fd)
+
+            read_fd, write_fd = (int(fd) for fd in auth.split(","))
+            os.fstat(read_fd)
+            os.fstat(write_fd)
+            return cls(read_fd, write_fd)
+        except (OSError, ValueError):
+            return None
+
+    def read_token(self):
+        while True:
+            # The pipe of the parent make may be non-blocking
+            try:
+                token = os.read(self.read_fd, 1)
+            except BlockingIOError:
+                select.select([self.read_fd], [], [])
+                continue
+
+            if token:
+                return token
+
+    # Blocks until a job may start, returns the token to release afterwards
+    def acquire(self):
+        with self.lock:
+            if not self.implicit_used:
+                self.implicit_used = True
+                return None
+
+        return self.read_token()
+
+    def release(self, token):
+        if token is None:
+            with self.lock:
+                self.implicit_used = False
+        else:
+            os.write(self.write_fd, token)
+
+    def close(self):
+        os.close(self.read_fd)
+        if self.write_fd != self.read_fd:
+            os.close(self.write_fd)
+
+
+# The JobServer of this process while it is open
+SERVER = None
+
+
+# A jobserver created by make.py for the processes its handlers start,
+# described in MAKEFLAGS as a pipe the way GNU make does, which every make
+# version and other jobserver clients understand. Jobs of make.py itself
+# take tokens from it as well.
+#
+# Only processes started by the Context helpers are told about it, with the
+# `makeflags` passed in their environment and the pipe passed on to them.
+# The environment of make.py itself is left alone, since other processes
+# would see the jobserver without getting its pipe.
+class JobServer(JobServerClient):
+    def __init__(self, jobs):
+        global SERVER
+
+        read_fd, write_fd = os.pipe()
+        super().__init__(read_fd, write_fd)
+        os.write(write_fd, TOKEN * (jobs - 1))
+
+        flags = [f"-j{jobs}", f"--jobserver-auth={read_fd},{write_fd}"]
+        makeflags = os.environ.get("MAKEFLAGS")
+        if makeflags:
+            flags.insert(0, makeflags)
+        self.makeflags = " ".join(flags)
+
+        SERVER = self
+
+    def close(self):
+        global SERVER
+
+        if SERVER is self:
+            SERVER = None
+        super().close()
+
+
+# Returns the descriptors of the jobserver pipe in MAKEFLAGS, which child
+# processes need to inherit to use it
+def jobserver_fds(makeflags):
+    auth = jobserver_auth(makeflags)
+    if auth is None or auth.startswith("fifo:"):
+        return ()
+
+    try:
+        return tuple(int(fd) for fd in auth.split(","))
+    except ValueError:
+        return ()
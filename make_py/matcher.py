@@ -1,9 +1,16 @@
 import re
+import sys
 
 from .task import Context
 from .util import escape_format_str
 
+# Called as source_hook(source, target, args) instead of callable sources
+# while a build is traced
+source_hook = None
 
+
+# Sources are interned, so a target used by many rules is kept in memory
+# once rather than once for every target depending on it
 def process_sources(target, sources, args):
     result = []
 
@@ -11,11 +18,14 @@ def process_sources(target, sources, args):
         if source is None:
             continue
         elif isinstance(source, str):
-            result.append(source.format(*args))
+            result.append(sys.intern(source.format(*args)))
         elif callable(source):
-            generated = source(target, args)
+            if source_hook is None:
+                generated = source(target, args)
+            else:
+                generated = source_hook(source, target, args)
             if generated:
-                result.extend(generated)
+                result.extend(map(sys.intern, generated))
         else:
             raise Exception("Unknown source:", source)
 
@@ -34,9 +44,11 @@ def escape_target(target, f):
 
 
 class RegularExpressionMatcher:
-    def __init__(self, target, sources):
+    def __init__(self, target, sources, outputs=()):
         self.target_re = re.compile(target)
         self.sources = sources
+        # Files the rule writes besides the target, written like sources
+        self.outputs = outputs
 
     def match(self, target):
         m = self.target_re.fullmatch(target)
@@ -44,12 +56,29 @@ class RegularExpressionMatcher:
             sources = process_sources(target, self.sources, m.groups())
             return Context(target=target, sources=sources)
 
+    # The other outputs of a target this matcher matches
+    def outputs_of(self, target):
+        if not self.outputs:
+            return []
+
+        args = self.target_re.fullmatch(target).groups()
+        return process_sources(target, self.outputs, args)
+
 
 class PercentPatternMatcher(RegularExpressionMatcher):
-    def __init__(self, target, sources):
+    def __init__(self, target, sources, outputs=()):
+        # Literal text around the wildcards, used by RuleIndex to narrow
+        # down candidate rules without running the regular expression
+        self.prefix = target[: target.find("%")]
+        self.suffix = target[target.rfind("%") + 1 :]
+
+        def translate(source):
+            return escape_format_str(source).replace("%", "{}")
+
         super().__init__(
             escape_target(target, self.translate_target),
-            escape_sources(sources, lambda s: escape_format_str(s).replace("%", "{}")),
+            escape_sources(sources, translate),
+            escape_sources(outputs, translate),
         )
 
     @staticmethod
@@ -60,8 +89,11 @@ class PercentPatternMatcher(RegularExpressionMatcher):
 
 
 class PlainTextMatcher(RegularExpressionMatcher):
-    def __init__(self, target, sources):
+    def __init__(self, target, sources, outputs=()):
+        self.literal = target
+
         super().__init__(
             escape_target(target, lambda t: re.escape(t)),
             escape_sources(sources, escape_format_str),
+            escape_sources(outputs, escape_format_str),
         )
@@ -5,6 +5,9 @@ from pathlib import Path
 class StorageManager:
     def __init__(self):
         self.storages = {}
+        # Paths of the storages used by PersistentVariables, as opposed to
+        # the ones make.py keeps its own state in
+        self.variables = set()
 
     def load(self):
         for path, storage in self.storages.items():
@@ -23,10 +26,13 @@ class StorageManager:
             with open(path, "w+") as f:
                 json.dump(storage, f)
 
+    def get_variable_storages(self):
+        return {path: self.storages[path] for path in self.variables}
+
     def get_storage(self, path):
         abs_path = Path(path).resolve()
         storage = self.storages.get(abs_path)
-        if storage:
+        if storage is not None:
             return abs_path, storage
 
         storage = {}
@@ -40,6 +46,7 @@ STORAGE = StorageManager()
 class PersistentVariables:
     def __init__(self, filename):
         self.path, self.storage = STORAGE.get_storage(filename)
+        STORAGE.variables.add(self.path)
 
     def __getitem__(self, item):
         return VariableProxy(self.storage, item)
@@ -0,0 +1,123 @@
+import cProfile
+import time
+from contextlib import contextmanager
+
+from . import matcher
+
+PHASES = ["load", "resolve", "build"]
+
+
+# Measures how long the phases of make.py take and counts the work done in
+# them, to find out whether loading the Makefile, matching rules, callable
+# sources or stat calls dominate a build. Optionally profiles the resolve
+# phase with cProfile.
+#
+# Like Tracer, it hooks into the instances it is given instead of being
+# checked on every call, so it costs nothing unless it is used.
+class PhaseProfiler:
+    def __init__(self, profile_path=None):
+        self.times = dict.fromkeys(PHASES, 0.0)
+        self.counts = {
+            "rules loaded": 0,
+            "matcher calls": 0,
+            "regex matches": 0,
+            "callables invoked": 0,
+            "stats issued": 0,
+            "jobs": 0,
+        }
+
+        self.profile_path = profile_path
+        self.profile = cProfile.Profile() if profile_path else None
+
+    @contextmanager
+    def phase(self, name):
+        profile = self.profile if name == "resolve" else None
+        if profile is not None:
+            profile.enable()
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.times[name] += time.perf_counter() - start
+            if profile is not None:
+                profile.disable()
+
+    def counting_stat(self, stat):
+        def counted(path):
+            self.counts["stats issued"] += 1
+            return stat(path)
+
+        return counted
+
+    def counting_match(self, match):
+        def counted(target):
+            self.counts["matcher calls"] += 1
+            ctx = match(target)
+            if ctx:
+                self.counts["regex matches"] += 1
+            return ctx
+
+        return counted
+
+    def install(self, fs):
+        fs.stat = self.counting_stat(fs.stat)
+
+        hook = matcher.source_hook
+
+        def call_source(source, target, args):
+            self.counts["callables invoked"] += 1
+            if hook is None:
+                return source(target, args)
+            return hook(source, target, args)
+
+        matcher.source_hook = call_source
+
+    def install_rules(self, rules):
+        self.counts["rules loaded"] += len(rules.tasks)
+        for task in rules.tasks:
+            task.matcher.match = self.counting_match(task.matcher.match)
+
+    # Times resolving as its own phase and the rest of `execute` as building
+    def install_executor(self, executor):
+        prepare, execute = executor.prepare, executor.execute
+
+        def timed_prepare(targets):
+            with self.phase("resolve"):
+                return prepare(targets)
+
+        def timed_execute(targets):
+            start = time.perf_counter()
+            resolving = self.times["resolve"]
+            try:
+                return execute(targets)
+            finally:
+                resolved = self.times["resolve"] - resolving
+                self.times["build"] += time.perf_counter() - start - resolved
+                self.counts["jobs"] += sum(
+                    job.ran for job in executor.job_pool.jobs.values()
+                )
+
+        executor.prepare = timed_prepare
+        executor.execute = timed_execute
+
+    def uninstall(self):
+        matcher.source_hook = None
+
+    # Returns the report, with counts kept elsewhere such as cache hits
+    # added to it
+    def report(self, counts=None):
+        lines = ["Phase        Time (s)"]
+        for name in PHASES:
+            lines.append(f"{name:<12} {self.times[name]:8.3f}")
+
+        lines.append("")
+        for name, count in {**self.counts, **(counts or {})}.items():
+            lines.append(f"{name:<20} {count:10}")
+
+        if self.profile is not None:
+            self.profile.dump_stats(self.profile_path)
+            lines.append("")
+            lines.append(f"Profile of the resolve phase written to {self.profile_path}")
+
+        return "\n".join(lines)
@@ -0,0 +1,129 @@
+import multiprocessing
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from threading import Lock
+
+from .persistence import STORAGE
+from .task import TASKS
+
+EXECUTORS = ["thread", "process"]
+
+# Tasks of the Makefile in a worker process, inherited from the parent by
+# forked workers and loaded from the Makefile by spawned ones
+_tasks = None
+
+
+def _load_tasks(script):
+    global _tasks
+
+    if _tasks is None:
+        from .session import load_script
+
+        load_script(script)
+        _tasks = TASKS
+
+    return _tasks
+
+
+def _ready():
+    pass
+
+
+def _run_task(index, ctx, variables, script):
+    tasks = _load_tasks(script)
+    for path, values in variables.items():
+        storage = STORAGE.storages.setdefault(path, {})
+        storage.clear()
+        storage.update(values)
+
+    tasks[index].run(ctx)
+
+    # Send back the persistent variables the handler set or deleted, so
+    # variables set by jobs running at the same time are all kept
+    changes = {}
+    for path, storage in STORAGE.get_variable_storages().items():
+        before = variables.get(path, {})
+        updated = {
+            name: value
+            for name, value in storage.items()
+            if name not in before or before[name] != value
+        }
+        deleted = [name for name in before if name not in storage]
+        if updated or deleted:
+            changes[path] = (updated, deleted)
+
+    return changes
+
+
+# Runs task handlers in worker processes so pure Python handlers aren't
+# serialized by the GIL.
+#
+# Workers are forked where possible, so they inherit the loaded Makefile and
+# tasks are sent by their position only. Otherwise the Makefile is loaded
+# again in every worker. Persistent variables are sent along with every task
+# and the variables the handler changed are merged back.
+class ProcessPool:
+    def __init__(self, tasks, jobs, script=None):
+        self.tasks = tasks
+        self.positions = {task: i for i, task in enumerate(tasks)}
+        self.jobs = jobs
+        self.script = script
+
+        self.pool = None
+        self.lock = Lock()
+
+    # ProcessPoolExecutor only takes an initializer and a multiprocessing
+    # context since Python 3.7, so forked workers get the tasks through the
+    # module global instead, and Python 3.6 uses the default start method,
+    # which forks where possible
+    def create(self):
+        global _tasks
+
+        if sys.version_info < (3, 7):
+            if multiprocessing.get_start_method() == "fork":
+                _tasks = self.tasks
+            return ProcessPoolExecutor(max_workers=self.jobs)
+
+        if "fork" in multiprocessing.get_all_start_methods():
+            _tasks = self.tasks
+            context = multiprocessing.get_context("fork")
+        else:
+            context = multiprocessing.get_context("spawn")
+
+        return ProcessPoolExecutor(max_workers=self.jobs, mp_context=context)
+
+    # Starts all workers. A worker forked while another thread holds a lock
+    # inherits the lock held forever, so executors call this before they
+    # start their own threads.
+    def start(self):
+        with self.lock:
+            if self.pool is not None:
+                return
+
+            self.pool = self.create()
+            # Workers are only started as tasks are submitted
+            for future in [self.pool.submit(_ready) for _ in range(self.jobs)]:
+                future.result()
+
+    def run(self, task, ctx):
+        self.start()
+
+        variables = {
+            path: dict(storage)
+            for path, storage in STORAGE.get_variable_storages().items()
+        }
+        position = self.positions[task]
+        future = self.pool.submit(_run_task, position, ctx, variables, self.script)
+
+        changes = future.result()
+        with self.lock:
+            for path, (updated, deleted) in changes.items():
+                storage = STORAGE.storages[path]
+                storage.update(updated)
+                for name in deleted:
+                    storage.pop(name, None)
+
+    def shutdown(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
@@ -0,0 +1,294 @@
+import http.client
+import os
+import shutil
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from pathlib import Path
+from queue import Empty, LifoQueue
+from socketserver import ThreadingMixIn
+from threading import BoundedSemaphore, Lock
+from urllib.parse import urlsplit
+
+
+# Backends are the shared stores rule outputs are exchanged through, keyed
+# by the action cache key. They provide:
+#
+#   get(key)           the stored bytes, or None if the key is missing
+#   put(key, data)     stores the bytes
+#   contains(keys)     the subset of `keys` that are present
+#   close()            releases connections and other resources
+
+
+# A directory shared between machines, e.g. over NFS
+class DirectoryBackend:
+    def __init__(self, directory):
+        self.directory = Path(directory)
+
+    def path(self, key):
+        return self.directory / key[:2] / key
+
+    def get(self, key):
+        try:
+            return self.path(key).read_bytes()
+        except FileNotFoundError:
+            return None
+
+    def put(self, key, data):
+        path = self.path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name("{}.{}.tmp".format(key, os.getpid()))
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+
+    def contains(self, keys):
+        return {key for key in keys if self.path(key).exists()}
+
+    def close(self):
+        pass
+
+
+# A plain HTTP server storing blobs with GET, PUT and HEAD on /<key>.
+# Connections are kept alive and reused between requests.
+class HttpBackend:
+    def __init__(self, url, max_connections=8, timeout=30):
+        parts = urlsplit(url)
+        if parts.scheme == "https":
+            self.connection_class = http.client.HTTPSConnection
+        else:
+            self.connection_class = http.client.HTTPConnection
+
+        self.netloc = parts.netloc
+        self.prefix = parts.path.rstrip("/")
+        self.timeout = timeout
+
+        self.max_connections = max_connections
+        self.idle = LifoQueue()
+        self.slots = BoundedSemaphore(max_connections)
+
+    def request(self, method, key, body=None):
+        self.slots.acquire()
+        try:
+            try:
+                connection = self.idle.get_nowait()
+            except Empty:
+                connection = self.connection_class(self.netloc, timeout=self.timeout)
+
+            try:
+                connection.request(method, "{}/{}".format(self.prefix, key), body=body)
+                response = connection.getresponse()
+                data = response.read()
+            except Exception:
+                connection.close()
+                raise
+
+            self.idle.put(connection)
+            return response.status, data
+        finally:
+            self.slots.release()
+
+    def get(self, key):
+        status, data = self.request("GET", key)
+        if status == 404:
+            return None
+        if status != 200:
+            raise http.client.HTTPException("GET {} returned {}".format(key, status))
+        return data
+
+    def put(self, key, data):
+        status, _ = self.request("PUT", key, data)
+        if status not in (200, 201, 204):
+            raise http.client.HTTPException("PUT {} returned {}".format(key, status))
+
+    def contains(self, keys):
+        keys = list(keys)
+        with ThreadPoolExecutor(max_workers=self.max_connections) as pool:
+            statuses = pool.map(lambda key: self.request("HEAD", key)[0], keys)
+            return {key for key, status in zip(keys, statuses) if status == 200}
+
+    def close(self):
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except Empty:
+                break
+
+
+def open_backend(location):
+    if location.startswith("http://") or location.startswith("https://"):
+        return HttpBackend(location)
+
+    if location.startswith("file://"):
+        location = location[len("file://") :]
+
+    return DirectoryBackend(location)
+
+
+# Downloads cache entries from a backend and uploads new ones in background
+# threads. Failures of the backend are counted but never fail the build.
+class RemoteCache:
+    def __init__(self, backend, upload_threads=4):
+        self.backend = backend
+        self.uploads = ThreadPoolExecutor(max_workers=upload_threads)
+        self.missing = set()
+
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self.bytes_downloaded = 0
+        self.bytes_uploaded = 0
+
+    def count(self, **amounts):
+        with self.lock:
+            for name, amount in amounts.items():
+                setattr(self, name, getattr(self, name) + amount)
+
+    # Checks which keys exist with one batch of requests, so later fetches
+    # of missing keys don't have to go to the backend
+    def prefetch(self, keys):
+        keys = set(keys)
+        try:
+            present = self.backend.contains(keys)
+        except Exception:
+            self.count(errors=1)
+            return
+
+        with self.lock:
+            self.missing |= keys - present
+
+    def fetch(self, key, path):
+        if key in self.missing:
+            self.count(misses=1)
+            return False
+
+        try:
+            data = self.backend.get(key)
+        except Exception:
+            self.count(errors=1)
+            return False
+
+        if data is None:
+            self.count(misses=1)
+            return False
+
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name("{}.{}.tmp".format(path.name, os.getpid()))
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+
+        self.count(hits=1, bytes_downloaded=len(data))
+        return True
+
+    def upload(self, key, path):
+        data = Path(path).read_bytes()
+
+        def put():
+            try:
+                self.backend.put(key, data)
+            except Exception:
+                self.count(errors=1)
+            else:
+                self.count(bytes_uploaded=len(data))
+
+        self.uploads.submit(put)
+
+    def close(self):
+        self.uploads.shutdown()
+        self.backend.close()
+
+    def stats(self):
+        return (
+            "Remote cache: {} hits, {} misses, {} errors, {} bytes downloaded, "
+            "{} bytes uploaded".format(
+                self.hits,
+                self.misses,
+                self.errors,
+                self.bytes_downloaded,
+                self.bytes_uploaded,
+            )
+        )
+
+
+# Serves a directory with the protocol HttpBackend speaks, as a stand-in
+# for a real cache server
+class CacheRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    directory = "."
+
+    def path_of(self):
+        key = self.path.rsplit("/", 1)[-1]
+        if not key or key.startswith("."):
+            return None
+        return Path(self.directory) / key[:2] / key
+
+    def send_blob(self, with_body):
+        path = self.path_of()
+        if path is None or not path.is_file():
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Length", str(path.stat().st_size))
+        self.end_headers()
+        if with_body:
+            with open(path, "rb") as f:
+                shutil.copyfileobj(f, self.wfile)
+
+    def do_GET(self):
+        self.send_blob(with_body=True)
+
+    def do_HEAD(self):
+        self.send_blob(with_body=False)
+
+    def do_PUT(self):
+        path = self.path_of()
+        length = int(self.headers.get("Content-Length", 0))
+        data = self.rfile.read(length)
+
+        if path is None:
+            self.send_response(400)
+        else:
+            DirectoryBackend(self.directory).put(path.name, data)
+            self.send_response(201)
+
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+# http.server.ThreadingHTTPServer, which needs Python 3.7
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def create_server(directory, host="127.0.0.1", port=0):
+    handler = type(
+        "DirectoryCacheRequestHandler",
+        (CacheRequestHandler,),
+        {"directory": str(directory)},
+    )
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def main():
+    arg_parser = ArgumentParser()
+    arg_parser.add_argument("directory")
+    arg_parser.add_argument("--host", default="127.0.0.1")
+    arg_parser.add_argument("-p", "--port", type=int, default=8080)
+
+    args = arg_parser.parse_args()
+    server = create_server(args.directory, args.host, args.port)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+import os
+
+SIZE_UNITS = {"": 1, "k": 1 << 10, "m": 1 << 20, "g": 1 << 30, "t": 1 << 40}
+
+
+# Parses sizes such as 512, "300M" or "2G" into bytes
+def parse_size(size):
+    if isinstance(size, (int, float)):
+        return int(size)
+
+    text = size.strip().lower()
+    if text.endswith("b"):
+        text = text[:-1]
+
+    unit = text[-1:] if text[-1:] in SIZE_UNITS else ""
+    number = text[: len(text) - len(unit)]
+    try:
+        return int(float(number) * SIZE_UNITS[unit])
+    except ValueError:
+        raise Exception(f"Invalid size: {size}")
+
+
+# 1 minute load average of the system
+def load_average():
+    try:
+        with open("/proc/loadavg") as f:
+            return float(f.read().split()[0])
+    except (OSError, ValueError, IndexError):
+        pass
+
+    try:
+        return os.getloadavg()[0]
+    except (OSError, AttributeError):
+        return 0.0
+
+
+# Memory available for new processes in bytes, None if it is unknown
+def available_memory():
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+
+    return None
+
+
+# Holds back starting new jobs while the system is busy, like the
+# -l/--load-average option of GNU make, or while starting a job could leave
+# less than `reserve_memory` bytes available.
+#
+# Rules can declare how much memory their jobs use with `memory=`. The
+# declared memory of running jobs is subtracted from what the system reports
+# as available, as jobs that just started haven't allocated it yet. One job
+# is always allowed to run, so the build never stalls.
+class ResourceLimits:
+    def __init__(
+        self,
+        max_load=None,
+        reserve_memory=None,
+        retry_interval=0.5,
+        read_load=load_average,
+        read_memory=available_memory,
+    ):
+        self.max_load = max_load
+        self.reserve_memory = reserve_memory
+        # How long held back jobs wait before the limits are checked again,
+        # in case nothing finishes meanwhile
+        self.retry_interval = retry_interval
+        self.read_load = read_load
+        self.read_memory = read_memory
+
+        self.running = 0
+        self.running_memory = 0
+
+    # Whether no job may start right now, whatever it needs
+    def busy(self):
+        if self.running == 0 or self.max_load is None:
+            return False
+
+        return self.read_load() >= self.max_load
+
+    # Whether the job may start now, assuming the limits aren't busy
+    def fits(self, job):
+        memory = job.task.memory
+        if self.running == 0 or (self.reserve_memory is None and not memory):
+            return True
+
+        available = self.read_memory()
+        if available is None:
+            return True
+
+        reserve = self.reserve_memory or 0
+        return available - self.running_memory - memory >= reserve
+
+    def started(self, job):
+        self.running += 1
+        self.running_memory += job.task.memory
+
+    def finished(self, job):
+        self.running -= 1
+        self.running_memory -= job.task.memory
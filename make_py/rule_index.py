@@ -0,0 +1,84 @@
+from .matcher import PercentPatternMatcher, PlainTextMatcher
+
+# Key under which rule positions are stored in a trie node. Every other key
+# is a single character, so it can never collide.
+_RULES = ""
+
+
+class LiteralTrie:
+    def __init__(self):
+        self.root = {}
+
+    def add(self, key, value):
+        node = self.root
+        for c in key:
+            node = node.setdefault(c, {})
+        node.setdefault(_RULES, []).append(value)
+
+    def prefixes_of(self, text):
+        # Yields the values of every key that is a prefix of `text`
+        node = self.root
+        yield from node.get(_RULES, ())
+        for c in text:
+            node = node.get(c)
+            if node is None:
+                return
+            yield from node.get(_RULES, ())
+
+
+# Finds the first task matching a target without trying every rule.
+#
+# Plain text rules are looked up by name, percent pattern rules are narrowed
+# down by their literal prefix and suffix, and only true regular expression
+# rules are tried against every target. Candidates are tried in declaration
+# order, so the first matching rule still wins.
+class RuleIndex:
+    def __init__(self, tasks):
+        self.tasks = list(tasks)
+
+        self.exact = {}
+        self.prefixes = LiteralTrie()
+        self.suffixes = LiteralTrie()
+        self.fallback = []
+
+        for i, task in enumerate(self.tasks):
+            matcher = task.matcher
+            if isinstance(matcher, PlainTextMatcher):
+                self.exact.setdefault(matcher.literal, []).append(i)
+            elif isinstance(matcher, PercentPatternMatcher):
+                self.prefixes.add(matcher.prefix, i)
+                self.suffixes.add(matcher.suffix[::-1], i)
+            else:
+                self.fallback.append(i)
+
+    def __len__(self):
+        return len(self.tasks)
+
+    def candidates(self, target):
+        by_prefix = set(self.prefixes.prefixes_of(target))
+        if by_prefix:
+            by_suffix = set(self.suffixes.prefixes_of(target[::-1]))
+            by_prefix &= by_suffix
+
+        candidates = list(by_prefix)
+        candidates.extend(self.exact.get(target, ()))
+        candidates.extend(self.fallback)
+        candidates.sort()
+        return candidates
+
+    # Returns the position of the first matching task and its context, or
+    # (None, None)
+    def match_position(self, target):
+        for i in self.candidates(target):
+            ctx = self.tasks[i].matcher.match(target)
+            if ctx:
+                return i, ctx
+
+        return None, None
+
+    def match(self, target):
+        i, ctx = self.match_position(target)
+        if ctx:
+            return self.tasks[i], ctx
+
+        return None, None
@@ -0,0 +1,137 @@
+from heapq import heappop, heappush
+from itertools import count
+from threading import Condition
+
+SCHEDULES = ["critical-path", "fifo"]
+
+
+# Jobs whose dependencies have all finished, handed out to workers with the
+# highest priority first. Jobs with the same priority are handed out in the
+# order they became ready.
+#
+# Jobs are only handed out while they fit their pool and the ResourceLimits,
+# if any. Jobs that don't fit are skipped in favour of ready jobs that do, so
+# no worker idles while something else could run, and every handed out job
+# must be reported back with `task_done`. Jobs waiting for a full pool are
+# set aside until a job of that pool finishes.
+class ReadyQueue:
+    def __init__(self, limits=None, pools=None):
+        self.heap = []
+        self.seq = count()
+        self.closed = False
+        self.changed = Condition()
+        self.limits = limits
+
+        # Name -> depth, total weight of running jobs and waiting jobs of
+        # every pool
+        self.pools = pools or {}
+        self.pool_usage = dict.fromkeys(self.pools, 0)
+        self.pool_waiting = {name: [] for name in self.pools}
+
+    def put(self, job):
+        with self.changed:
+            heappush(self.heap, (-job.priority, next(self.seq), job))
+            self.changed.notify()
+
+    def fits_pool(self, job):
+        name = job.task.pool
+        if name is None:
+            return True
+
+        # A job heavier than its pool runs once the pool is empty
+        usage = self.pool_usage[name]
+        return usage == 0 or usage + job.task.weight <= self.pools[name]
+
+    def pop(self):
+        limits = self.limits
+        if limits is not None and limits.busy():
+            return None
+
+        skipped = []
+        job = None
+        while self.heap:
+            entry = heappop(self.heap)
+            candidate = entry[2]
+            if not self.fits_pool(candidate):
+                self.pool_waiting[candidate.task.pool].append(entry)
+            elif limits is not None and not limits.fits(candidate):
+                skipped.append(entry)
+            else:
+                job = candidate
+                break
+
+        for entry in skipped:
+            heappush(self.heap, entry)
+
+        if job is not None:
+            if limits is not None:
+                limits.started(job)
+            if job.task.pool is not None:
+                self.pool_usage[job.task.pool] += job.task.weight
+        return job
+
+    # Blocks until a job is ready, returns None once the queue is closed
+    def get(self):
+        with self.changed:
+            while True:
+                if self.closed:
+                    return None
+
+                job = self.pop() if self.heap else None
+                if job is not None:
+                    return job
+
+                if self.heap:
+                    # Held back by the limits, which may change without
+                    # anything finishing
+                    self.changed.wait(self.limits.retry_interval)
+                else:
+                    self.changed.wait()
+
+    def get_nowait(self):
+        with self.changed:
+            if not self.heap or self.closed:
+                return None
+
+            return self.pop()
+
+    def task_done(self, job):
+        name = job.task.pool
+        if self.limits is None and name is None:
+            return
+
+        with self.changed:
+            if self.limits is not None:
+                self.limits.finished(job)
+
+            if name is not None:
+                self.pool_usage[name] -= job.task.weight
+                for entry in self.pool_waiting[name]:
+                    heappush(self.heap, entry)
+                self.pool_waiting[name].clear()
+
+            self.changed.notify_all()
+
+    def close(self):
+        with self.changed:
+            self.closed = True
+            self.changed.notify_all()
+
+
+def estimate_durations(jobs, durations):
+    known = [durations[job.target] for job in jobs if job.target in durations]
+    default = sum(known) / len(known) if known else 1.0
+
+    return {job: durations.get(job.target, default) for job in jobs}
+
+
+# Sets the priority of every job to the estimated time from its start to the
+# end of the build, following the longest chain of jobs depending on it.
+# `jobs` must be ordered so that every job comes after its dependencies.
+def assign_critical_path_priorities(jobs, durations):
+    jobs = list(jobs)
+    estimated = estimate_durations(jobs, durations)
+
+    for job in reversed(jobs):
+        longest_tail = max((dep.priority for dep in job.depended_by), default=0)
+        job.priority = estimated[job] + longest_tail
@@ -0,0 +1,248 @@
+import importlib.util
+import os
+import sys
+import time
+
+from .async_executor import AsyncExecutor
+from .cache import ActionCache
+from .executor import BuildError, Executor, JobPool
+from .filesystem import FileSystem
+from .fingerprint import Fingerprints
+from .graph_cache import GraphCache
+from .history import History
+from .jobserver import JobServer, JobServerClient, makeflags_jobs
+from .persistence import STORAGE
+from .phases import PhaseProfiler
+from .remote_cache import RemoteCache, open_backend
+from .resources import ResourceLimits, parse_size
+from .rule_index import RuleIndex
+from .task import POOLS, TASKS
+from .trace import Tracer
+
+
+def load_script(path):
+    sys.dont_write_bytecode = True
+    spec = importlib.util.spec_from_file_location("makefile", path)
+    makefile = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(makefile)
+
+
+# State shared by all builds of one make.py invocation: the loaded Makefile,
+# the rule index, the stat cache and the persistent build records. The
+# daemon keeps a session alive between builds.
+class Session:
+    def __init__(self, args):
+        self.args = args
+        self.fs = FileSystem(scan_directories=args.scan_directories)
+        self.tracer = None
+        if args.trace:
+            self.tracer = Tracer()
+            self.tracer.install(self.fs)
+        self.profiler = None
+        if args.profile_phases:
+            self.profiler = PhaseProfiler(args.profile_output)
+            self.profiler.install(self.fs)
+        self.load()
+
+        # Every target and source resolved by the last build
+        self.touched = set()
+        self.history = History()
+        self.durations = self.history.durations()
+        self.fingerprints = Fingerprints() if args.fingerprint == "hash" else None
+
+        self.remote = None
+        if args.remote_cache:
+            self.remote = RemoteCache(open_backend(args.remote_cache))
+
+        self.cache = None
+        if args.cache_dir or self.remote is not None:
+            self.cache = ActionCache(
+                args.cache_dir or ".make_py/cache",
+                max_size=args.cache_size,
+                remote=self.remote,
+            )
+            if self.fingerprints is not None:
+                self.cache.file_hash = self.fingerprints.file_hash
+
+        self.limits = None
+        if args.load_average is not None or args.reserve_memory is not None:
+            reserve = args.reserve_memory
+            self.limits = ResourceLimits(
+                max_load=args.load_average,
+                reserve_memory=None if reserve is None else parse_size(reserve),
+            )
+
+        # The jobserver of a make running this build, if any
+        self.jobserver = None
+        if not args.no_jobserver:
+            self.jobserver = JobServerClient.connect(os.environ.get("MAKEFLAGS"))
+
+        STORAGE.load()
+
+    def load(self):
+        tracer = self.tracer
+        if tracer is not None:
+            start = tracer.now()
+
+        TASKS.clear()
+        POOLS.clear()
+        if self.profiler is not None:
+            with self.profiler.phase("load"):
+                load_script(self.args.file)
+        else:
+            load_script(self.args.file)
+        self.rules = RuleIndex(TASKS)
+        if self.profiler is not None:
+            self.profiler.install_rules(self.rules)
+
+        if tracer is not None:
+            tracer.complete("load", "load", start, rules=len(TASKS))
+        self.pools = dict(POOLS)
+
+        self.graph = None
+        if not self.args.no_graph_cache:
+            self.graph = GraphCache(
+                ".make_py/graph.bin", TASKS, self.fs, script=self.args.file
+            )
+            self.graph.load()
+
+    # Drops changed paths from the stat cache, or everything if the Makefile
+    # itself changed, in which case it is loaded again
+    def invalidate(self, changed):
+        makefile = os.path.normpath(self.args.file)
+        if makefile in {os.path.normpath(path) for path in changed}:
+            self.load()
+            self.fs.clear()
+            return
+
+        for path in changed:
+            self.fs.invalidate(path)
+
+        # Removed directories are reported by themselves
+        directories = {path for path in changed if not os.path.isfile(path)}
+        for path in [p for p in self.fs.cache if os.path.dirname(p) in directories]:
+            self.fs.invalidate(path)
+
+    def create_executor(self, jobs, jobserver=None):
+        args = self.args
+        executor_class = AsyncExecutor if args.engine == "asyncio" else Executor
+
+        executor = executor_class(
+            self.fs,
+            JobPool(),
+            self.rules,
+            jobs=jobs,
+            schedule=args.schedule,
+            durations=self.durations,
+            fingerprints=self.fingerprints,
+            restat=args.restat,
+            executor=args.executor,
+            script=args.file,
+            cache=self.cache,
+            graph=self.graph,
+            limits=self.limits,
+            pools=self.pools,
+            jobserver=jobserver,
+            keep_going=args.keep_going,
+            tracer=self.tracer,
+        )
+        if self.profiler is not None:
+            self.profiler.install_executor(executor)
+        return executor
+
+    # Builds the targets and returns the jobs that ran, in the order they
+    # were started
+    def build(self, targets, jobs=None):
+        jobserver = self.jobserver
+        if jobserver is not None:
+            # The jobserver limits how many jobs actually run
+            makeflags = os.environ.get("MAKEFLAGS")
+            jobs = jobs or self.args.jobs or makeflags_jobs(makeflags)
+            jobs = jobs or os.cpu_count() or 1
+        else:
+            jobs = jobs or self.args.jobs or 1
+            # Shares the job limit with builds started by handlers
+            if jobs > 1 and not self.args.no_jobserver:
+                jobserver = JobServer(jobs)
+
+        if self.args.serial_targets:
+            builds = [[target] for target in targets]
+        else:
+            builds = [targets]
+
+        ran = []
+        failures = []
+        self.touched = set()
+        try:
+            for targets in builds:
+                # Phony tasks such as `clean` may change any file
+                if any(job.task.phony for job in ran):
+                    self.fs.clear()
+
+                executor = self.create_executor(jobs, jobserver)
+                start = time.monotonic()
+                try:
+                    executor.execute(targets)
+                except BuildError as e:
+                    if not self.args.keep_going:
+                        raise
+                    failures.extend(e.failures)
+                finally:
+                    self.touched.update(executor.job_pool.resolved)
+                    pool = executor.job_pool
+                    self.history.record(
+                        pool.jobs.values(), jobs, start, time.monotonic()
+                    )
+                ran.extend(
+                    sorted(
+                        (job for job in pool.jobs.values() if job.ran),
+                        key=lambda job: job.job_no(),
+                    )
+                )
+        finally:
+            STORAGE.dump()
+            if self.graph is not None:
+                self.graph.dump()
+            if jobserver is not None and jobserver is not self.jobserver:
+                jobserver.close()
+            if self.tracer is not None:
+                self.tracer.dump(self.args.trace)
+
+        if failures:
+            raise BuildError(failures)
+
+        return ran
+
+    # Resolves the targets without running anything, to find out what they
+    # depend on after a build changed files callable sources read
+    def resolve(self, targets):
+        executor = self.create_executor(1)
+        for target in targets:
+            executor.resolve(None, target)
+
+        self.touched = set(executor.job_pool.resolved)
+
+    def close(self):
+        if self.tracer is not None:
+            self.tracer.uninstall()
+
+        if self.profiler is not None:
+            self.profiler.uninstall()
+            counts = {}
+            if self.graph is not None:
+                counts["graph cache hits"] = self.graph.hits
+                counts["graph cache misses"] = self.graph.misses
+            if self.cache is not None:
+                counts["action cache hits"] = self.cache.hits
+                counts["action cache misses"] = self.cache.misses
+            print(self.profiler.report(counts))
+
+        if self.args.cache_stats:
+            if self.cache is not None:
+                print(self.cache.stats())
+            if self.graph is not None:
+                print(self.graph.stats())
+
+        if self.remote is not None:
+            self.remote.close()
+            print(self.remote.stats())
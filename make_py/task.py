@@ -1,4 +1,92 @@
+import asyncio
+import inspect
+import os
+import subprocess
+from subprocess import CalledProcessError
+from threading import Lock
+
+from . import jobserver
+from .resources import parse_size
+from .util import run_coroutine
+
 TASKS = []
+# Name -> depth of the pools declared with `pool`
+POOLS = {}
+
+
+# Processes started by the Context helpers that are still running, so that
+# a cancelled build can terminate them
+PROCESSES = set()
+PROCESSES_LOCK = Lock()
+# Whether the build was cancelled, so processes started afterwards by jobs
+# that were already running are terminated right away
+TERMINATED = False
+
+
+def register_process(process):
+    with PROCESSES_LOCK:
+        PROCESSES.add(process)
+        terminated = TERMINATED
+
+    if terminated:
+        terminate_process(process)
+
+
+def unregister_process(process):
+    with PROCESSES_LOCK:
+        PROCESSES.discard(process)
+
+
+def terminate_process(process):
+    try:
+        process.terminate()
+    except ProcessLookupError:
+        pass
+
+
+def terminate_processes():
+    global TERMINATED
+
+    with PROCESSES_LOCK:
+        TERMINATED = True
+        processes = list(PROCESSES)
+
+    for process in processes:
+        terminate_process(process)
+
+
+# Called at the start of every build
+def reset_processes():
+    global TERMINATED
+
+    with PROCESSES_LOCK:
+        TERMINATED = False
+
+
+# Passes the jobserver on to child processes, so builds they run share the
+# job limit: the one make.py created through MAKEFLAGS in their environment,
+# or the one of a make running make.py, whose MAKEFLAGS they inherit
+def subprocess_options(kwargs):
+    if "pass_fds" in kwargs or not kwargs.get("close_fds", True):
+        return kwargs
+
+    server = jobserver.SERVER
+    env = kwargs.get("env")
+    if server is not None and (env is None or "MAKEFLAGS" not in env):
+        env = dict(os.environ if env is None else env, MAKEFLAGS=server.makeflags)
+        kwargs = dict(kwargs, env=env)
+
+    makeflags = (os.environ if env is None else env).get("MAKEFLAGS")
+
+    fds = []
+    for fd in jobserver.jobserver_fds(makeflags):
+        try:
+            os.fstat(fd)
+        except OSError:
+            continue
+        fds.append(fd)
+
+    return dict(kwargs, pass_fds=fds) if fds else kwargs
 
 
 class Context:
@@ -10,12 +98,101 @@ class Context:
     def source(self):
         return self.sources[0]
 
+    # Like subprocess.check_call and check_output, but the processes are
+    # terminated when the build is cancelled and can use the jobserver
+    def check_call(self, args, **kwargs):
+        self.run_process(args, kwargs)
+
+    def check_output(self, args, **kwargs):
+        return self.run_process(args, dict(kwargs, stdout=subprocess.PIPE))
+
+    @staticmethod
+    def run_process(args, kwargs):
+        with subprocess.Popen(args, **subprocess_options(kwargs)) as process:
+            register_process(process)
+            try:
+                output, _ = process.communicate()
+            finally:
+                unregister_process(process)
+
+        if process.returncode != 0:
+            raise CalledProcessError(process.returncode, args, output)
+
+        return output
+
+    async def check_call_async(self, args, **kwargs):
+        await self.run_process_async(args, kwargs)
+
+    async def check_output_async(self, args, **kwargs):
+        kwargs = dict(kwargs, stdout=asyncio.subprocess.PIPE)
+        return await self.run_process_async(args, kwargs)
+
+    @staticmethod
+    async def run_process_async(args, kwargs):
+        process = await asyncio.create_subprocess_exec(
+            *args, **subprocess_options(kwargs)
+        )
+        register_process(process)
+        try:
+            output, _ = await process.communicate()
+        except asyncio.CancelledError:
+            process.kill()
+            await process.wait()
+            raise
+        finally:
+            unregister_process(process)
+
+        if process.returncode != 0:
+            raise CalledProcessError(process.returncode, args, output)
+
+        return output
+
 
 class Task:
-    def __init__(self, matcher, handler, phony=False):
+    def __init__(
+        self,
+        matcher,
+        handler,
+        phony=False,
+        restat=False,
+        executor=None,
+        cache=False,
+        cache_env=(),
+        cache_vars=(),
+        memory=0,
+        pool=None,
+        weight=1,
+    ):
         self.matcher = matcher
         self.handler = handler
         self.phony = phony
+        # Dependents are only rebuilt if the target's timestamp changed
+        self.restat = restat
+        # "thread" or "process", None to use the default of the build
+        self.executor = executor
+
+        # Whether the output can be restored from the action cache, and the
+        # names of environment variables and persistent variables that
+        # influence it besides the sources
+        self.cache = cache
+        self.cache_env = cache_env
+        self.cache_vars = cache_vars
+
+        # Memory a job of this task is expected to use, in bytes or as a
+        # size such as "2G", see ResourceLimits
+        self.memory = parse_size(memory)
+
+        # Jobs of the same pool only run while their weights add up to at
+        # most the depth of the pool
+        self.pool = pool
+        self.weight = weight
+
+    @property
+    def is_async(self):
+        return inspect.iscoroutinefunction(self.handler)
 
     def run(self, ctx):
-        self.handler(ctx)
+        if self.is_async:
+            run_coroutine(self.handler(ctx))
+        else:
+            self.handler(ctx)
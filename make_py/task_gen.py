@@ -1,10 +1,14 @@
 from .matcher import RegularExpressionMatcher, PercentPatternMatcher, PlainTextMatcher
-from .task import TASKS, Task
+from .task import POOLS, TASKS, Task
 from .util import to_list
 
 
-def rule(target, sources, regex=False, phony=False):
+# Other options, such as `restat` or `executor`, are passed on to Task.
+# `outputs` lists the files the rule writes besides the target, written
+# like sources, so the action cache stores and restores them too.
+def rule(target, sources, regex=False, phony=False, outputs=(), **options):
     sources = to_list(sources)
+    outputs = to_list(outputs)
 
     def wrap(func):
         if regex:
@@ -16,9 +20,10 @@ def rule(target, sources, regex=False, phony=False):
 
         TASKS.append(
             Task(
-                matcher=matcher(sources=sources, target=target),
+                matcher=matcher(sources=sources, target=target, outputs=outputs),
                 handler=func,
                 phony=phony,
+                **options,
             )
         )
 
@@ -27,7 +32,7 @@ def rule(target, sources, regex=False, phony=False):
     return wrap
 
 
-def task(sources=None, name=None):
+def task(sources=None, name=None, **options):
     if sources is None:
         sources = []
 
@@ -37,10 +42,30 @@ def task(sources=None, name=None):
         else:
             target = name
 
-        return rule(target, sources, phony=True)(func)
+        return rule(target, sources, phony=True, **options)(func)
 
     return wrap
 
 
 def phony_task(name, sources=None):
     task(sources, name=name)(lambda _: None)
+
+
+# Declares the files a callable source reads, as returned by
+# `inputs(target, target_regex_groups)`. Its result is then remembered
+# between builds and it is only called again once one of them changes.
+def source_inputs(inputs):
+    def wrap(func):
+        func.inputs = inputs
+        return func
+
+    return wrap
+
+
+# Declares a pool rules can be put in with `pool=name`, letting jobs weighing
+# at most `depth` in total run at the same time
+def pool(name, depth):
+    if depth < 1:
+        raise Exception(f"Pool '{name}' must have a depth of at least 1")
+
+    POOLS[name] = depth
@@ -0,0 +1,115 @@
+import json
+import os
+import threading
+from time import perf_counter
+
+from . import matcher
+
+# Thread id of the main thread in traces, workers are numbered from 1
+MAIN_THREAD = 0
+
+
+# Records what a build spends its time on as Chrome Trace Event format,
+# viewable in chrome://tracing or https://ui.perfetto.dev.
+#
+# Jobs are recorded per worker, the resolve phase and the stat calls and
+# callable sources it runs on the main thread. Nothing is instrumented unless
+# a tracer is created: the executor only checks whether it has one, and the
+# file system and callable sources are hooked by `install`.
+class Tracer:
+    def __init__(self):
+        self.start = perf_counter()
+        self.events = []
+        self.local = threading.local()
+        self.named_threads = set()
+
+        # Totals, also reported in the arguments of resolve events
+        self.stat_calls = 0
+        self.stat_time = 0.0
+        self.source_calls = 0
+        self.source_time = 0.0
+
+    # Microseconds since the tracer was created
+    def now(self):
+        return (perf_counter() - self.start) * 1e6
+
+    @property
+    def tid(self):
+        return getattr(self.local, "tid", MAIN_THREAD)
+
+    # Makes events of the calling thread show up as the given thread
+    def set_thread(self, tid, name):
+        self.local.tid = tid
+        if tid not in self.named_threads:
+            self.named_threads.add(tid)
+            self.events.append(
+                {
+                    "name": "thread_name",
+                    "ph": "M",
+                    "pid": os.getpid(),
+                    "tid": tid,
+                    "args": {"name": name},
+                }
+            )
+
+    # Records an event that started at `start` and ends now, on the calling
+    # thread unless another `tid` is given
+    def complete(self, name, category, start, tid=None, **args):
+        event = {
+            "name": name,
+            "cat": category,
+            "ph": "X",
+            "ts": start,
+            "dur": self.now() - start,
+            "pid": os.getpid(),
+            "tid": self.tid if tid is None else tid,
+        }
+        if args:
+            event["args"] = args
+        self.events.append(event)
+        return event
+
+    def traced_stat(self, stat):
+        def traced(path):
+            start = self.now()
+            try:
+                return stat(path)
+            finally:
+                event = self.complete("stat", "fs", start, path=path)
+                self.stat_calls += 1
+                self.stat_time += event["dur"]
+
+        return traced
+
+    def call_source(self, source, target, args):
+        start = self.now()
+        try:
+            return source(target, args)
+        finally:
+            name = getattr(source, "__qualname__", repr(source))
+            event = self.complete(name, "source", start, target=target)
+            self.source_calls += 1
+            self.source_time += event["dur"]
+
+    # Hooks the stat calls of the file system and every callable source
+    def install(self, fs):
+        self.set_thread(MAIN_THREAD, "main")
+        fs.stat = self.traced_stat(fs.stat)
+        matcher.source_hook = self.call_source
+
+    def uninstall(self):
+        matcher.source_hook = None
+
+    def totals(self):
+        return {
+            "stat_calls": self.stat_calls,
+            "stat_ms": self.stat_time / 1000,
+            "source_calls": self.source_calls,
+            "source_ms": self.source_time / 1000,
+        }
+
+    def dump(self, path):
+        tmp = "{}.{}.tmp".format(path, os.getpid())
+        with open(tmp, "w") as f:
+            json.dump({"traceEvents": self.events, "displayTimeUnit": "ms"}, f)
+        os.replace(tmp, path)
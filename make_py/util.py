@@ -1,3 +1,9 @@
+import asyncio
+import os
+import sys
+from threading import Lock, Thread
+
+
 def escape_format_str(text):
     return text.replace("{", "{{").replace("}", "}}")
 
@@ -8,3 +14,80 @@ def to_list(thing):
             thing = [thing]
 
     return thing
+
+
+# Python 3.6 and 3.7 watch child processes by handling SIGCHLD in the event
+# loop of the main thread, so event loops in other threads, which run the
+# async handlers of the thread executor, can't start subprocesses. Like the
+# ThreadedChildWatcher of Python 3.8, this waits for every child in a thread.
+THREADED_CHILD_WATCHER = sys.version_info < (3, 8) and os.name == "posix"
+
+if THREADED_CHILD_WATCHER:
+
+    class ThreadedChildWatcher(asyncio.AbstractChildWatcher):
+        def add_child_handler(self, pid, callback, *args):
+            loop = asyncio.get_event_loop()
+            thread = Thread(
+                target=self.wait, args=(loop, pid, callback, args), daemon=True
+            )
+            thread.start()
+
+        @staticmethod
+        def wait(loop, pid, callback, args):
+            try:
+                _, status = os.waitpid(pid, 0)
+            except ChildProcessError:
+                returncode = 255
+            else:
+                if os.WIFSIGNALED(status):
+                    returncode = -os.WTERMSIG(status)
+                elif os.WIFEXITED(status):
+                    returncode = os.WEXITSTATUS(status)
+                else:
+                    returncode = status
+
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(callback, pid, returncode, *args)
+
+        def remove_child_handler(self, pid):
+            return True
+
+        def attach_loop(self, loop):
+            pass
+
+        def close(self):
+            pass
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc_info):
+            pass
+
+
+WATCHER_LOCK = Lock()
+
+
+def install_child_watcher():
+    if not THREADED_CHILD_WATCHER:
+        return
+
+    with WATCHER_LOCK:
+        if not isinstance(asyncio.get_child_watcher(), ThreadedChildWatcher):
+            asyncio.set_child_watcher(ThreadedChildWatcher())
+
+
+# asyncio.run, which needs Python 3.7
+def run_coroutine(coroutine):
+    install_child_watcher()
+
+    loop = asyncio.new_event_loop()
+    try:
+        asyncio.set_event_loop(loop)
+        return loop.run_until_complete(coroutine)
+    finally:
+        try:
+            loop.run_until_complete(loop.shutdown_asyncgens())
+        finally:
+            asyncio.set_event_loop(None)
+            loop.close()
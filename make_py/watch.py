@@ -0,0 +1,72 @@
+import traceback
+
+from .executor import BuildError
+from .watcher import create_watcher
+
+
+# Rebuilds the targets whenever one of the files they were resolved from
+# changes. Every cycle resolves the targets again with the stat cache of the
+# previous one, minus the changed paths, so only jobs affected by the change
+# run and callable sources see the new content of the files they read.
+class WatchLoop:
+    def __init__(self, session, targets, watcher=None, debounce=0.1):
+        self.session = session
+        self.targets = targets
+        self.watcher = watcher if watcher is not None else create_watcher()
+        self.debounce = debounce
+
+        self.watcher.watch([session.args.file])
+
+    def build(self):
+        try:
+            ran = self.session.build(self.targets)
+        except BuildError as e:
+            e.report()
+            ran = []
+        except Exception:
+            traceback.print_exc()
+            ran = []
+
+        # Files written by the build are only dropped from the stat cache
+        # instead of triggering another build
+        changed = self.watcher.wait(timeout=0)
+        if changed:
+            self.session.invalidate(changed)
+
+        # Jobs that ran may have changed files callable sources read, such
+        # as dependency files written by compilers, so resolve again to
+        # watch what the targets depend on now
+        if ran:
+            try:
+                self.session.resolve(self.targets)
+            except Exception:
+                traceback.print_exc()
+
+        self.watcher.watch(self.session.touched)
+
+    # Waits until something changes and returns all paths changed until
+    # nothing did for `debounce` seconds
+    def wait_for_changes(self):
+        changed = self.watcher.wait()
+        while True:
+            more = self.watcher.wait(timeout=self.debounce)
+            if not more:
+                break
+            changed |= more
+
+        self.session.invalidate(changed)
+        return changed
+
+    def run(self):
+        try:
+            while True:
+                self.build()
+
+                changed = self.wait_for_changes()
+                print(
+                    "make.py: {} changed, rebuilding".format(", ".join(sorted(changed)))
+                )
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.watcher.close()
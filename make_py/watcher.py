@@ -0,0 +1,189 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import time
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (
+    IN_MODIFY
+    | IN_ATTRIB
+    | IN_CLOSE_WRITE
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+    | IN_DELETE_SELF
+    | IN_MOVE_SELF
+)
+
+EVENT_HEADER = struct.Struct("iIII")
+
+
+# Both watchers report changed paths the way they were watched: a file
+# "a.c" in the working directory is reported as "a.c", not "./a.c". A
+# change of a watched directory's content is reported for the file inside
+# it, even if that file itself wasn't watched.
+
+
+# Notices changes by comparing stat results, for platforms without inotify
+class PollingWatcher:
+    def __init__(self, interval=0.5):
+        self.interval = interval
+        self.stats = {}
+        self.directories = {}
+
+    @staticmethod
+    def stat(path):
+        try:
+            st = os.stat(path)
+            return st.st_mtime_ns, st.st_size
+        except OSError:
+            return None
+
+    @staticmethod
+    def listdir(directory):
+        try:
+            return set(os.listdir(directory or "."))
+        except OSError:
+            return set()
+
+    def watch(self, paths):
+        for path in paths:
+            if path not in self.stats:
+                self.stats[path] = self.stat(path)
+
+            directory = os.path.dirname(path)
+            if directory not in self.directories:
+                self.directories[directory] = self.listdir(directory)
+
+    def poll(self):
+        changed = set()
+        for path, old in self.stats.items():
+            new = self.stat(path)
+            if new != old:
+                self.stats[path] = new
+                changed.add(path)
+
+        for directory, old in self.directories.items():
+            new = self.listdir(directory)
+            if new != old:
+                self.directories[directory] = new
+                changed.update(os.path.join(directory, name) for name in new ^ old)
+
+        return changed
+
+    # Returns the paths changed since the last call, waiting up to `timeout`
+    # seconds (forever if None) for the first change
+    def wait(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            changed = self.poll()
+            if changed:
+                return changed
+
+            if deadline is not None and time.monotonic() >= deadline:
+                return set()
+
+            time.sleep(self.interval)
+
+    def close(self):
+        pass
+
+
+# Watches the directories containing the watched paths with inotify
+class InotifyWatcher:
+    def __init__(self):
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+        self.directories = {}
+        self.descriptors = {}
+
+    def watch(self, paths):
+        for path in paths:
+            directory = os.path.dirname(path)
+            if directory in self.directories:
+                continue
+
+            wd = self.libc.inotify_add_watch(
+                self.fd, os.fsencode(directory or "."), WATCH_MASK
+            )
+            # Directories that don't exist yet can't be watched, they are
+            # tried again the next time paths are watched
+            if wd < 0:
+                continue
+
+            self.directories[directory] = wd
+            self.descriptors[wd] = directory
+
+    def read_events(self):
+        changed = set()
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return changed
+
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+                offset += EVENT_HEADER.size
+                name = data[offset : offset + length].rstrip(b"\0")
+                offset += length
+
+                directory = self.descriptors.get(wd)
+                if mask & IN_Q_OVERFLOW:
+                    # Events were lost, report everything watched
+                    changed.update(self.directories)
+                if directory is None:
+                    continue
+
+                if mask & (IN_IGNORED | IN_DELETE_SELF | IN_MOVE_SELF):
+                    del self.descriptors[wd]
+                    del self.directories[directory]
+                    changed.add(directory)
+                elif name:
+                    changed.add(os.path.join(directory, os.fsdecode(name)))
+
+    def wait(self, timeout=None):
+        changed = self.read_events()
+        if changed:
+            return changed
+
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return set()
+
+        return self.read_events()
+
+    def close(self):
+        os.close(self.fd)
+
+
+def create_watcher(polling_interval=0.5):
+    if sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher()
+        except (OSError, AttributeError):
+            pass
+
+    return PollingWatcher(polling_interval)
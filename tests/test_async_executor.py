@@ -0,0 +1,118 @@
+import asyncio
+import sys
+from subprocess import CalledProcessError
+from threading import get_ident
+
+import pytest
+
+from make_py.async_executor import AsyncExecutor
+from make_py.executor import BuildError, Executor, JobPool
+from make_py.matcher import PlainTextMatcher
+from make_py.task import Task
+
+from test_executor import TestFileSystem
+
+
+def phony(target, handler, sources=None):
+    return Task(
+        matcher=PlainTextMatcher(target=target, sources=sources or []),
+        handler=handler,
+        phony=True,
+    )
+
+
+def execute(tasks, target, jobs=1, executor_class=AsyncExecutor):
+    executor = executor_class(
+        TestFileSystem({}), JobPool(), tasks, silent=True, jobs=jobs
+    )
+    executor.execute(target)
+
+
+def test_async_handlers_overlap():
+    events = {}
+    overlapped = []
+
+    def wait_for(other):
+        async def handler(ctx):
+            events.setdefault(ctx.target, asyncio.Event()).set()
+            other_event = events.setdefault(other, asyncio.Event())
+            await asyncio.wait_for(other_event.wait(), timeout=5)
+            overlapped.append(ctx.target)
+
+        return handler
+
+    tasks = [
+        phony("task1", wait_for("task2")),
+        phony("task2", wait_for("task1")),
+        phony("all", lambda _: None, ["task1", "task2"]),
+    ]
+
+    execute(tasks, "all", jobs=2)
+
+    assert sorted(overlapped) == ["task1", "task2"]
+
+
+def test_sync_handlers_offloaded():
+    threads = []
+    order = []
+
+    async def record(ctx):
+        order.append(ctx.target)
+
+    def sync(ctx):
+        threads.append(get_ident())
+        order.append(ctx.target)
+
+    tasks = [
+        phony("sync", sync),
+        phony("all", record, ["sync"]),
+    ]
+
+    execute(tasks, "all")
+
+    assert threads[0] != get_ident()
+    assert order == ["sync", "all"]
+
+
+def test_check_call_async():
+    outputs = []
+
+    async def run(ctx):
+        output = await ctx.check_output_async(
+            [sys.executable, "-c", "print('hello')"]
+        )
+        outputs.append(output.strip())
+        await ctx.check_call_async([sys.executable, "-c", "exit(3)"])
+
+    with pytest.raises(BuildError) as error:
+        execute([phony("all", run)], "all")
+
+    assert isinstance(error.value.failures[0][1], CalledProcessError)
+
+    assert outputs == [b"hello"]
+
+
+def test_async_handler_in_thread_executor():
+    run = []
+
+    async def handler(ctx):
+        await asyncio.sleep(0)
+        run.append(ctx.target)
+
+    execute([phony("all", handler)], "all", executor_class=Executor)
+
+    assert run == ["all"]
+
+
+def test_check_output_async_in_thread_executor():
+    outputs = []
+
+    async def run(ctx):
+        output = await ctx.check_output_async(
+            [sys.executable, "-c", "print('hello')"]
+        )
+        outputs.append(output.strip())
+
+    execute([phony("all", run)], "all", jobs=2, executor_class=Executor)
+
+    assert outputs == [b"hello"]
@@ -0,0 +1,180 @@
+import builtins
+import os
+
+from make_py.cache import ENTRY, OUTPUT, ActionCache, handler_identity
+from make_py.executor import Executor, JobPool
+from make_py.filesystem import FileSystem
+from make_py.matcher import PercentPatternMatcher
+from make_py.persistence import PersistentVariables
+from make_py.task import Context, Task
+
+
+def compile(ctx):
+    with open(ctx.source) as s, open(ctx.target, "w") as t:
+        t.write(s.read().upper())
+
+
+def compile_task(**options):
+    return Task(
+        matcher=PercentPatternMatcher(target="%.o", sources=["%.c"]),
+        handler=compile,
+        cache=True,
+        **options,
+    )
+
+
+def build(cache, target, handler):
+    built = []
+
+    def record(ctx):
+        built.append(ctx.target)
+        handler(ctx)
+
+    task = compile_task()
+    task.handler = record
+
+    Executor(FileSystem(), JobPool(), [task], silent=True, cache=cache).execute(target)
+    return built
+
+
+def test_restore_from_cache(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    cache = ActionCache(tmp_path / "cache")
+
+    (tmp_path / "a.c").write_text("a")
+    assert build(cache, "a.o", compile) == ["a.o"]
+    assert cache.misses == 1
+
+    os.unlink("a.o")
+    assert build(cache, "a.o", compile) == []
+    assert (tmp_path / "a.o").read_text() == "A"
+    assert cache.hits == 1
+
+    (tmp_path / "a.c").write_text("b")
+    assert build(cache, "a.o", compile) == ["a.o"]
+    assert (tmp_path / "a.o").read_text() == "B"
+
+
+def test_key(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    cache = ActionCache(tmp_path / "cache")
+    variables = PersistentVariables(tmp_path / "variables.json")
+
+    (tmp_path / "a.c").write_text("a")
+    ctx = Context(sources=["a.c"], target="a.o")
+
+    task = compile_task(cache_env=["MAKE_PY_TEST_FLAGS"], cache_vars=[variables["CC"]])
+    key = cache.key(task, ctx)
+    assert cache.key(task, ctx) == key
+
+    monkeypatch.setenv("MAKE_PY_TEST_FLAGS", "-O2")
+    env_key = cache.key(task, ctx)
+    assert env_key != key
+
+    variables["CC"].set("clang")
+    assert cache.key(task, ctx) not in [key, env_key]
+
+    other = compile_task()
+    other.handler = lambda ctx: None
+    assert cache.key(other, ctx) != cache.key(compile_task(), ctx)
+    assert cache.key(compile_task(), Context(sources=["a.c"], target="b.o")) != key
+
+
+def load_handler(source, filename):
+    namespace = {"__name__": "makefile"}
+    exec(builtins.compile(source, filename, "exec"), namespace)
+    return namespace["link"]
+
+
+def test_handler_identity():
+    source = """
+def link(ctx):
+    flags = {"-O2", "-g"}
+    return [lambda: flags]
+"""
+    first = load_handler(source, "/checkout/a/Makefile.py")
+    # Another checkout, with the rule further down the Makefile
+    moved = load_handler("\n\n" + source, "/checkout/b/Makefile.py")
+    changed = load_handler(source.replace("-O2", "-O3"), "/checkout/a/Makefile.py")
+
+    assert handler_identity(first) == handler_identity(moved)
+    assert handler_identity(first) != handler_identity(changed)
+
+
+def test_restore_all_outputs(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    cache = ActionCache(tmp_path / "cache")
+    built = []
+
+    def link(ctx):
+        built.append(ctx.target)
+        with open(ctx.target, "w") as f:
+            f.write("#!/bin/sh\n")
+        os.chmod(ctx.target, 0o755)
+        with open(ctx.target + ".map", "w") as f:
+            f.write("map")
+
+    task = Task(
+        matcher=PercentPatternMatcher(
+            target="%.bin", sources=["%.c"], outputs=["%.bin.map"]
+        ),
+        handler=link,
+        cache=True,
+    )
+
+    (tmp_path / "a.c").write_text("a")
+    Executor(FileSystem(), JobPool(), [task], silent=True, cache=cache).execute("a.bin")
+    os.unlink("a.bin")
+    os.unlink("a.bin.map")
+
+    Executor(FileSystem(), JobPool(), [task], silent=True, cache=cache).execute("a.bin")
+    assert built == ["a.bin"]
+    assert cache.hits == 1
+    assert (tmp_path / "a.bin.map").read_text() == "map"
+    assert os.access("a.bin", os.X_OK)
+
+    # Entries holding fewer outputs than asked for are misses
+    assert not cache.restore(cache.key(task, Context(["a.c"], "a.bin")), ["a.bin"])
+
+
+def test_lru_eviction(tmp_path):
+    entry_size = ENTRY.size + OUTPUT.size + 10
+    cache = ActionCache(tmp_path / "cache", max_size=2 * entry_size + 5)
+
+    for i, key in enumerate(["aa01", "bb02", "cc03"]):
+        output = tmp_path / key
+        output.write_text("x" * 10)
+        cache.store(key, [output])
+        os.utime(cache.entry(key), (i, i))
+
+    assert cache.evicted == 1
+    assert not cache.entry("aa01").exists()
+
+    assert cache.restore("bb02", [str(tmp_path / "restored")])
+
+    output = tmp_path / "dd04"
+    output.write_text("x" * 10)
+    cache.store("dd04", [output])
+
+    assert cache.entry("bb02").exists()
+    assert not cache.entry("cc03").exists()
+    assert cache.size() == 2 * entry_size
+
+
+def test_size_counts_entries_once(tmp_path):
+    entry_size = ENTRY.size + OUTPUT.size + 10
+    output = tmp_path / "a.o"
+    output.write_text("x" * 10)
+
+    cache = ActionCache(tmp_path / "cache")
+    cache.store("aa01", [output])
+    assert cache.size() == entry_size
+
+    # Storing a key again replaces its entry
+    cache.store("aa01", [output])
+    assert cache.size() == entry_size
+
+    # The size of entries already in the cache is counted once
+    cache = ActionCache(tmp_path / "cache")
+    cache.store("bb02", [output])
+    assert cache.size() == 2 * entry_size
@@ -0,0 +1,69 @@
+import os
+from pathlib import Path
+from threading import Thread
+
+import pytest
+
+from make_py.__main__ import create_arg_parser
+from make_py.daemon import Daemon, request
+from make_py.session import Session
+from make_py.task import TASKS
+
+MAKEFILE = """
+from make_py import rule, phony_task
+
+phony_task("all", "b.txt")
+
+
+@rule("b.txt", "a.txt")
+def copy(ctx):
+    with open(ctx.source) as s, open(ctx.target, "w") as t:
+        t.write(s.read())
+"""
+
+
+@pytest.fixture
+def daemon(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    Path("Makefile.py").write_text(MAKEFILE)
+    Path("a.txt").write_text("a")
+
+    TASKS.clear()
+    session = Session(create_arg_parser().parse_args([]))
+    daemon = Daemon(session, str(tmp_path / "daemon.sock"))
+
+    thread = Thread(target=daemon.serve)
+    thread.start()
+    while not os.path.exists(daemon.socket_path):
+        pass
+
+    yield daemon
+
+    request({"shutdown": True}, daemon.socket_path)
+    thread.join()
+    session.close()
+
+
+def build(daemon, capsys):
+    message = {"cwd": os.getcwd(), "targets": ["all"], "jobs": None}
+    assert request(message, daemon.socket_path) == 0
+    return capsys.readouterr().out
+
+
+def test_daemon(daemon, capsys):
+    assert "copy: b.txt <- a.txt" in build(daemon, capsys)
+    assert Path("b.txt").read_text() == "a"
+
+    # Only the phony target is run again
+    assert build(daemon, capsys) == "[1/1] all: b.txt\n"
+    assert build(daemon, capsys) == "[1/1] all: b.txt\n"
+
+    Path("a.txt").write_text("changed")
+    assert "copy: b.txt <- a.txt" in build(daemon, capsys)
+    assert Path("b.txt").read_text() == "changed"
+
+
+def test_wrong_directory(daemon, capsys):
+    message = {"cwd": "/", "targets": ["all"], "jobs": None}
+    assert request(message, daemon.socket_path) == 1
+    assert "daemon serves" in capsys.readouterr().out
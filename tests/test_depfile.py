@@ -0,0 +1,63 @@
+import os
+
+from make_py import depfile
+from make_py.depfile import parse_depfile, read_depfile
+
+
+def test_parse_depfile():
+    text = (
+        "build/main.o: main.c hello.h \\\n"
+        "  dir\\ with\\ spaces/a.h \\\r\n"
+        "  cost$$.h c:/include/b.h\n"
+        "\n"
+        "# comment\n"
+        "a.o b.o: common.h # trailing comment\n"
+        "a.o:: | order.h\n"
+        "hello.h:\n"
+    )
+
+    assert parse_depfile(text) == {
+        "build/main.o": [
+            "main.c",
+            "hello.h",
+            "dir with spaces/a.h",
+            "cost$.h",
+            "c:/include/b.h",
+        ],
+        "a.o": ["common.h", "order.h"],
+        "b.o": ["common.h"],
+        "hello.h": [],
+    }
+
+
+def test_depfile_source(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.mkdir("build")
+    source = depfile()
+
+    assert source("build/a.o", ("a",)) is None
+
+    with open("build/a.d", "w") as f:
+        f.write("build/a.o: a.c a.h a.c\n")
+    assert source("build/a.o", ("a",)) == ["a.c", "a.h"]
+    assert source.inputs("build/a.o", ("a",)) == ["build/a.d"]
+
+    # Depfiles listing other targets contribute all of their prerequisites
+    with open("other.d", "w") as f:
+        f.write("x.o: x.c\ny.o: y.c\n")
+    assert depfile("%.d")("b.o", ("other",)) == ["x.c", "y.c"]
+
+
+def test_reparse_only_on_change(tmp_path):
+    path = str(tmp_path / "a.d")
+    with open(path, "w") as f:
+        f.write("a.o: a.c\n")
+
+    rules = read_depfile(path)
+    assert read_depfile(path) is rules
+
+    with open(path, "w") as f:
+        f.write("a.o: a.c a.h\n")
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    assert read_depfile(path) == {"a.o": ["a.c", "a.h"]}
@@ -39,6 +39,15 @@ def test_compile_c():
     assert not (Path(".") / "build").exists()
 
 
+def test_serial_targets():
+    run_example("compile_c")
+    run_example("compile_c", ["--serial-targets", "clean", "all"])
+
+    assert (Path(".") / "build" / "main").exists()
+
+    run_example("compile_c", ["clean"])
+
+
 def test_file_concat():
     run_example("file_concat", ["example1-example2.txt"])
 
@@ -1,8 +1,11 @@
+import sys
+import time
+from threading import Event, Lock
 from time import sleep
 
 import pytest
 
-from make_py.executor import Executor, JobPool
+from make_py.executor import BuildError, Executor, JobPool
 from make_py.matcher import (
     RegularExpressionMatcher,
     PlainTextMatcher,
@@ -27,6 +30,9 @@ class TestFileSystem:
 
         return node
 
+    def invalidate(self, path):
+        pass
+
     @staticmethod
     def make_parents(path):
         pass
@@ -35,8 +41,8 @@ class TestFileSystem:
 TestFileSystem.__test__ = False
 
 
-def create_test_executor(fs, tasks, jobs=1):
-    return Executor(fs, JobPool(), tasks, silent=True, jobs=jobs)
+def create_test_executor(fs, tasks, jobs=1, **kwargs):
+    return Executor(fs, JobPool(), tasks, silent=True, jobs=jobs, **kwargs)
 
 
 def fake_compile_tasks():
@@ -349,6 +355,50 @@ def test_parallelization():
     executor.execute("all")
 
 
+def test_parallelization_after_dependency():
+    task1_running = Event()
+    task2_running = Event()
+    overlapped = []
+
+    def task1(ctx):
+        task1_running.set()
+        overlapped.append(task2_running.wait(timeout=5))
+
+    def task2(ctx):
+        task2_running.set()
+        overlapped.append(task1_running.wait(timeout=5))
+
+    tasks = [
+        Task(
+            matcher=PlainTextMatcher(target="start", sources=[]),
+            handler=lambda _: sleep(0.2),
+            phony=True,
+        ),
+        Task(
+            matcher=PlainTextMatcher(target="task1", sources=["start"]),
+            handler=task1,
+            phony=True,
+        ),
+        Task(
+            matcher=PlainTextMatcher(target="task2", sources=["start"]),
+            handler=task2,
+            phony=True,
+        ),
+        Task(
+            matcher=PlainTextMatcher(target="all", sources=["task1", "task2"]),
+            handler=lambda _: None,
+            phony=True,
+        ),
+    ]
+
+    fs = TestFileSystem({})
+
+    executor = create_test_executor(fs, tasks, jobs=2)
+    executor.execute("all")
+
+    assert overlapped == [True, True]
+
+
 def test_order():
     finished = False
     link_after_compile_finished = False
@@ -427,7 +477,433 @@ def test_failure_task():
 
     fs = TestFileSystem({})
     executor = create_test_executor(fs, tasks, jobs=2)
-    executor.execute("all")
+    with pytest.raises(BuildError) as error:
+        executor.execute("all")
 
     assert task1_executed == 1
     assert task2_executed == 1
+    assert [target for target, _ in error.value.failures] == ["task2_1"]
+
+
+def test_keep_going():
+    built = []
+
+    def build(ctx):
+        if ctx.target.startswith("bad"):
+            raise Exception("Exception on purpose")
+        built.append(ctx.target)
+
+    tasks = [
+        Task(
+            matcher=RegularExpressionMatcher(target="(good|bad)\\d", sources=[]),
+            handler=build,
+            phony=True,
+        ),
+        Task(
+            matcher=PlainTextMatcher(target="after_good", sources=["good1"]),
+            handler=build,
+            phony=True,
+        ),
+        Task(
+            matcher=PlainTextMatcher(target="after_bad", sources=["bad1"]),
+            handler=build,
+            phony=True,
+        ),
+        Task(
+            matcher=PlainTextMatcher(
+                target="all", sources=["after_good", "after_bad", "bad2", "good2"]
+            ),
+            handler=build,
+            phony=True,
+        ),
+    ]
+
+    executor = create_test_executor(TestFileSystem({}), tasks, keep_going=True)
+    with pytest.raises(BuildError) as error:
+        executor.execute("all")
+
+    assert sorted(built) == ["after_good", "good1", "good2"]
+    assert sorted(target for target, _ in error.value.failures) == ["bad1", "bad2"]
+
+
+def test_cancel_terminates_processes():
+    started = Event()
+
+    def slow(ctx):
+        started.set()
+        ctx.check_call([sys.executable, "-c", "import time; time.sleep(30)"])
+
+    def fail(ctx):
+        started.wait(timeout=5)
+        sleep(0.1)
+        raise Exception("Exception on purpose")
+
+    tasks = [
+        Task(
+            matcher=PlainTextMatcher(target="slow", sources=[]),
+            handler=slow,
+            phony=True,
+        ),
+        Task(
+            matcher=PlainTextMatcher(target="fail", sources=[]),
+            handler=fail,
+            phony=True,
+        ),
+    ]
+
+    executor = create_test_executor(TestFileSystem({}), tasks, jobs=2)
+    start = time.monotonic()
+    with pytest.raises(BuildError) as error:
+        executor.execute(["slow", "fail"])
+
+    assert time.monotonic() - start < 10
+    assert [target for target, _ in error.value.failures] == ["fail"]
+
+
+def test_cancel_terminates_late_processes():
+    def late(ctx):
+        # Starts its process only once the build was cancelled
+        deadline = time.monotonic() + 5
+        while not executor.job_pool.cancelled and time.monotonic() < deadline:
+            sleep(0.01)
+        ctx.check_call([sys.executable, "-c", "import time; time.sleep(30)"])
+
+    def fail(ctx):
+        raise Exception("Exception on purpose")
+
+    tasks = [
+        Task(
+            matcher=PlainTextMatcher(target="late", sources=[]),
+            handler=late,
+            phony=True,
+        ),
+        Task(
+            matcher=PlainTextMatcher(target="fail", sources=[]),
+            handler=fail,
+            phony=True,
+        ),
+    ]
+
+    executor = create_test_executor(TestFileSystem({}), tasks, jobs=2)
+    start = time.monotonic()
+    with pytest.raises(BuildError) as error:
+        executor.execute(["late", "fail"])
+
+    assert time.monotonic() - start < 10
+    assert [target for target, _ in error.value.failures] == ["fail"]
+
+    # Processes of the next build aren't terminated
+    def run(ctx):
+        ctx.check_call([sys.executable, "-c", "import time; time.sleep(0.1)"])
+
+    task = Task(
+        matcher=PlainTextMatcher(target="run", sources=[]),
+        handler=run,
+        phony=True,
+    )
+    create_test_executor(TestFileSystem({}), [task]).execute("run")
+
+
+def critical_path_tasks(executed):
+    def record(ctx):
+        executed.append(ctx.target)
+
+    return [
+        Task(
+            matcher=PlainTextMatcher(target="compile", sources=[]),
+            handler=record,
+            phony=True,
+        ),
+        Task(
+            matcher=PlainTextMatcher(target="link", sources=["compile"]),
+            handler=record,
+            phony=True,
+        ),
+        Task(
+            matcher=PlainTextMatcher(target="short", sources=[]),
+            handler=record,
+            phony=True,
+        ),
+        Task(
+            matcher=PlainTextMatcher(target="all", sources=["short", "link"]),
+            handler=record,
+            phony=True,
+        ),
+    ]
+
+
+@pytest.mark.parametrize(
+    "schedule,expected",
+    [
+        ("fifo", ["short", "compile", "link", "all"]),
+        ("critical-path", ["compile", "link", "short", "all"]),
+    ],
+)
+def test_schedule(schedule, expected):
+    executed = []
+    durations = {"compile": 1, "link": 10, "short": 2, "all": 0}
+
+    fs = TestFileSystem({})
+    executor = create_test_executor(
+        fs, critical_path_tasks(executed), schedule=schedule, durations=durations
+    )
+    executor.execute("all")
+
+    assert executed == expected
+
+
+def test_durations_recorded():
+    durations = {}
+
+    fs = TestFileSystem({})
+    executor = create_test_executor(fs, critical_path_tasks([]), durations=durations)
+    executor.execute("all")
+
+    assert sorted(durations) == ["all", "compile", "link", "short"]
+
+
+def generator_tasks(fs_config, generated_ts, restat):
+    compiled = []
+
+    def generate(ctx):
+        if generated_ts is not None:
+            fs_config["gen.h"] = generated_ts
+
+    def compile(ctx):
+        compiled.append(ctx.target)
+
+    tasks = [
+        Task(
+            matcher=PlainTextMatcher(target="gen.h", sources=["gen.in"]),
+            handler=generate,
+            restat=restat,
+        ),
+        Task(
+            matcher=PlainTextMatcher(target="test.o", sources=["gen.h", "test.c"]),
+            handler=compile,
+        ),
+        Task(
+            matcher=PlainTextMatcher(target="all", sources=["test.o"]),
+            handler=compile,
+            phony=True,
+        ),
+    ]
+    return tasks, compiled
+
+
+@pytest.mark.parametrize(
+    "generated_ts,restat,expected",
+    [
+        (None, False, ["test.o", "all"]),
+        (None, True, ["all"]),
+        (130, True, ["test.o", "all"]),
+    ],
+)
+def test_restat(generated_ts, restat, expected):
+    fs_config = {"gen.in": 120, "gen.h": 100, "test.c": 100, "test.o": 110}
+    tasks, compiled = generator_tasks(fs_config, generated_ts, restat)
+
+    executor = create_test_executor(TestFileSystem(fs_config), tasks)
+    executor.execute("all")
+
+    assert compiled == expected
+
+
+def test_restat_option():
+    fs_config = {"gen.in": 120, "gen.h": 100, "test.c": 100, "test.o": 110}
+    tasks, compiled = generator_tasks(fs_config, None, False)
+
+    executor = create_test_executor(TestFileSystem(fs_config), tasks, restat=True)
+    executor.execute("all")
+
+    assert compiled == ["all"]
+
+
+def test_restat_with_stale_dependent():
+    fs_config = {"gen.in": 120, "gen.h": 100, "test.c": 115, "test.o": 110}
+    tasks, compiled = generator_tasks(fs_config, None, True)
+
+    executor = create_test_executor(TestFileSystem(fs_config), tasks)
+    executor.execute("all")
+
+    assert compiled == ["test.o", "all"]
+
+
+def test_deep_dependency_chain():
+    depth = 5000
+    built = []
+
+    tasks = [
+        Task(
+            matcher=RegularExpressionMatcher(
+                target=r"step([1-9]\d*)",
+                sources=[lambda target, args: [f"step{int(args[0]) - 1}"]],
+            ),
+            handler=lambda ctx: built.append(ctx.target),
+        )
+    ]
+
+    fs = TestFileSystem({"step0": 100})
+
+    executor = create_test_executor(fs, tasks)
+    executor.execute(f"step{depth}")
+
+    assert built == [f"step{i}" for i in range(1, depth + 1)]
+
+
+def test_dependency_cycle():
+    tasks = [
+        Task(
+            matcher=PlainTextMatcher(target="a", sources=["b"]),
+            handler=lambda _: None,
+        ),
+        Task(
+            matcher=PlainTextMatcher(target="b", sources=["c"]),
+            handler=lambda _: None,
+        ),
+        Task(
+            matcher=PlainTextMatcher(target="c", sources=["a"]),
+            handler=lambda _: None,
+        ),
+        Task(
+            matcher=PlainTextMatcher(target="all", sources=["b"]),
+            handler=lambda _: None,
+        ),
+    ]
+
+    executor = create_test_executor(TestFileSystem({}), tasks)
+    with pytest.raises(Exception, match="Dependency cycle: b -> c -> a -> b"):
+        executor.execute("all")
+
+
+def test_up_to_date_targets_resolved_once():
+    matched = []
+
+    def collect(target, args):
+        matched.append(target)
+
+    tasks = [
+        Task(
+            matcher=PercentPatternMatcher(target="%.o", sources=["%.c", collect]),
+            handler=lambda _: None,
+        ),
+        Task(
+            matcher=PlainTextMatcher(target="a", sources=["shared.o"]),
+            handler=lambda _: None,
+        ),
+        Task(
+            matcher=PlainTextMatcher(target="b", sources=["shared.o"]),
+            handler=lambda _: None,
+        ),
+        Task(
+            matcher=PlainTextMatcher(target="all", sources=["a", "b"]),
+            handler=lambda _: None,
+            phony=True,
+        ),
+    ]
+
+    fs = TestFileSystem({"shared.c": 100, "shared.o": 110, "a": 120, "b": 120})
+
+    executor = create_test_executor(fs, tasks)
+    executor.execute("all")
+
+    assert matched == ["shared.o"]
+
+
+def test_multiple_targets():
+    built = []
+    overlapped = []
+    running = {"lib": Event(), "docs": Event()}
+
+    def build(ctx):
+        built.append(ctx.target)
+
+    def wait_for(other):
+        def handler(ctx):
+            running[ctx.target].set()
+            overlapped.append(running[other].wait(timeout=5))
+
+        return handler
+
+    tasks = [
+        Task(
+            matcher=PlainTextMatcher(target="shared", sources=[]),
+            handler=build,
+            phony=True,
+        ),
+        Task(
+            matcher=PlainTextMatcher(target="lib", sources=["shared"]),
+            handler=wait_for("docs"),
+            phony=True,
+        ),
+        Task(
+            matcher=PlainTextMatcher(target="docs", sources=["shared"]),
+            handler=wait_for("lib"),
+            phony=True,
+        ),
+    ]
+
+    executor = create_test_executor(TestFileSystem({}), tasks, jobs=2)
+    executor.execute(["lib", "docs"])
+
+    assert built == ["shared"]
+    assert overlapped == [True, True]
+
+
+def test_pool_depth():
+    running = {"link": 0, "compile": 0}
+    most_links = 0
+    overlapped = []
+    lock = Lock()
+
+    def handler(kind):
+        def run(ctx):
+            nonlocal most_links
+            with lock:
+                running[kind] += 1
+                most_links = max(most_links, running["link"])
+            sleep(0.05)
+            with lock:
+                if kind == "compile":
+                    overlapped.append(running["link"] > 0)
+                running[kind] -= 1
+
+        return run
+
+    tasks = [
+        Task(
+            matcher=RegularExpressionMatcher(target="link(\\d)", sources=[]),
+            handler=handler("link"),
+            phony=True,
+            pool="link",
+        ),
+        Task(
+            matcher=RegularExpressionMatcher(target="compile(\\d)", sources=[]),
+            handler=handler("compile"),
+            phony=True,
+        ),
+    ]
+
+    targets = ["link1", "link2", "link3", "compile1", "compile2"]
+    executor = create_test_executor(
+        TestFileSystem({}), tasks, jobs=4, pools={"link": 1}
+    )
+    executor.execute(targets)
+
+    assert most_links == 1
+    assert overlapped == [True, True]
+
+
+def test_unknown_pool():
+    tasks = [
+        Task(
+            matcher=PlainTextMatcher(target="all", sources=[]),
+            handler=lambda _: None,
+            phony=True,
+            pool="missing",
+        )
+    ]
+
+    executor = create_test_executor(TestFileSystem({}), tasks, pools={})
+    with pytest.raises(Exception, match="Unknown pool 'missing'"):
+        executor.execute("all")
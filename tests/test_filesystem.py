@@ -0,0 +1,75 @@
+import os
+
+import pytest
+
+from make_py.filesystem import FileSystem
+
+
+@pytest.fixture
+def stat_calls(monkeypatch):
+    calls = []
+    stat = FileSystem.stat
+
+    def counting_stat(path):
+        calls.append(path)
+        return stat(path)
+
+    monkeypatch.setattr(FileSystem, "stat", staticmethod(counting_stat))
+    return calls
+
+
+@pytest.mark.parametrize("scan_directories", [False, True])
+def test_cache_and_invalidate(tmp_path, monkeypatch, scan_directories):
+    monkeypatch.chdir(tmp_path)
+    fs = FileSystem(scan_directories=scan_directories)
+
+    assert fs.get_timestamp("a.txt") is None
+
+    with open("a.txt", "w") as f:
+        f.write("a")
+    assert fs.get_timestamp("a.txt") is None
+
+    fs.invalidate("a.txt")
+    assert fs.get_timestamp("a.txt") == os.stat("a.txt").st_mtime
+
+    os.utime("a.txt", (0, 0))
+    assert fs.get_timestamp("a.txt") != 0
+
+    fs.invalidate("a.txt")
+    assert fs.get_timestamp("a.txt") == 0
+
+
+def test_negative_results_cached(tmp_path, monkeypatch, stat_calls):
+    monkeypatch.chdir(tmp_path)
+    fs = FileSystem()
+
+    assert fs.get_timestamp("missing") is None
+    assert fs.get_timestamp("missing") is None
+    assert stat_calls == ["missing"]
+
+
+def test_scan_directories(tmp_path, monkeypatch, stat_calls):
+    monkeypatch.chdir(tmp_path)
+    os.mkdir("src")
+    for name in ["a.c", "b.c"]:
+        with open(os.path.join("src", name), "w") as f:
+            f.write(name)
+
+    fs = FileSystem(scan_directories=True)
+
+    assert fs.get_timestamp("src/a.c") == os.stat("src/a.c").st_mtime
+    assert fs.get_timestamp("src/b.c") == os.stat("src/b.c").st_mtime
+    assert fs.get_timestamp("src/c.c") is None
+    assert fs.get_timestamp("build/c.o") is None
+    assert fs.get_timestamp("build/d.o") is None
+    # Only the paths that exist are stat'ed
+    assert stat_calls == ["src/a.c", "src/b.c"]
+    assert sorted(fs.listings) == ["build", "src"]
+
+    os.mkdir("build")
+    with open("build/c.o", "w") as f:
+        f.write("c")
+    fs.invalidate("build/c.o")
+
+    assert fs.get_timestamp("build/c.o") == os.stat("build/c.o").st_mtime
+    assert stat_calls == ["src/a.c", "src/b.c", "build/c.o"]
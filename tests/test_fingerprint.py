@@ -0,0 +1,124 @@
+import os
+
+from make_py.executor import Executor, JobPool
+from make_py.filesystem import FileSystem
+from make_py.fingerprint import Fingerprints, hash_file
+from make_py.matcher import PercentPatternMatcher
+from make_py.task import Task
+
+
+def build(fingerprints, target):
+    built = []
+
+    def compile(ctx):
+        built.append(ctx.target)
+        with open(ctx.target, "w") as f:
+            f.write("compiled")
+
+    tasks = [
+        Task(
+            matcher=PercentPatternMatcher(target="%.o", sources=["%.c"]),
+            handler=compile,
+        )
+    ]
+
+    executor = Executor(
+        FileSystem(), JobPool(), tasks, silent=True, fingerprints=fingerprints
+    )
+    executor.execute(target)
+    return built
+
+
+def touch(path, offset):
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + offset))
+
+
+def test_rebuild_only_on_content_change(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    fingerprints = Fingerprints(tmp_path / "fingerprints.json")
+
+    (tmp_path / "a.c").write_text("int a;")
+    assert build(fingerprints, "a.o") == ["a.o"]
+
+    touch("a.c", 10 ** 10)
+    assert build(fingerprints, "a.o") == []
+
+    (tmp_path / "a.c").write_text("int b;")
+    assert build(fingerprints, "a.o") == ["a.o"]
+
+
+def test_adopt_up_to_date_targets(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    fingerprints = Fingerprints(tmp_path / "fingerprints.json")
+
+    (tmp_path / "a.c").write_text("int a;")
+    (tmp_path / "a.o").write_text("compiled")
+    touch("a.o", 10 ** 10)
+
+    assert build(fingerprints, "a.o") == []
+    assert fingerprints.changed("a.o", ["a.c"]) is False
+
+    touch("a.c", 10 ** 11)
+    assert build(fingerprints, "a.o") == []
+
+
+def test_file_hash_short_circuit(tmp_path):
+    fingerprints = Fingerprints(tmp_path / "fingerprints.json")
+
+    path = tmp_path / "a.c"
+    path.write_text("aaaa")
+    digest = fingerprints.file_hash(str(path))
+    assert digest == hash_file(path)
+
+    # Same size and mtime, so the cached hash is returned without reading
+    st = os.stat(path)
+    path.write_text("bbbb")
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns))
+    assert fingerprints.file_hash(str(path)) == digest
+
+    touch(path, 10 ** 9)
+    assert fingerprints.file_hash(str(path)) == hash_file(path)
+
+    assert fingerprints.file_hash(str(tmp_path / "missing")) is None
+
+
+def test_unchanged_output_stops_rebuilds(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    fingerprints = Fingerprints(tmp_path / "fingerprints.json")
+    built = []
+
+    def generate(ctx):
+        built.append(ctx.target)
+        with open(ctx.target, "w") as f:
+            f.write("int a;")
+
+    def compile(ctx):
+        built.append(ctx.target)
+        with open(ctx.target, "w") as f:
+            f.write("compiled")
+
+    tasks = [
+        Task(
+            matcher=PercentPatternMatcher(target="%.c", sources=["%.in"]),
+            handler=generate,
+        ),
+        Task(
+            matcher=PercentPatternMatcher(target="%.o", sources=["%.c"]),
+            handler=compile,
+        ),
+    ]
+
+    def execute():
+        built.clear()
+        Executor(
+            FileSystem(), JobPool(), tasks, silent=True, fingerprints=fingerprints
+        ).execute("a.o")
+        return built
+
+    (tmp_path / "a.in").write_text("1")
+    assert execute() == ["a.c", "a.o"]
+
+    # The generated file is rewritten with the same content
+    (tmp_path / "a.in").write_text("2")
+    assert execute() == ["a.c"]
@@ -0,0 +1,133 @@
+import os
+
+from make_py.executor import Executor, JobPool
+from make_py.filesystem import FileSystem
+from make_py.graph_cache import GraphCache
+from make_py.matcher import PercentPatternMatcher
+from make_py.task import Task
+from make_py.task_gen import source_inputs
+
+
+def create_tasks(calls):
+    @source_inputs(lambda target, args: [args[0] + ".d"])
+    def dependencies(target, args):
+        calls.append(target)
+        with open(args[0] + ".d") as f:
+            return f.read().split()
+
+    def undeclared(target, args):
+        calls.append(target)
+        return []
+
+    return [
+        Task(
+            matcher=PercentPatternMatcher(target="%.o", sources=["%.c", dependencies]),
+            handler=lambda ctx: None,
+        ),
+        Task(
+            matcher=PercentPatternMatcher(target="%.x", sources=[undeclared]),
+            handler=lambda ctx: None,
+        ),
+    ]
+
+
+def resolve(tasks, targets, script=None):
+    fs = FileSystem()
+    graph = GraphCache("graph.bin", tasks, fs, script=script)
+    graph.load()
+
+    executor = Executor(fs, JobPool(), tasks, silent=True, graph=graph)
+    for target in targets:
+        executor.resolve(None, target)
+    graph.dump()
+
+    return executor, graph
+
+
+def write(path, content):
+    with open(path, "w") as f:
+        f.write(content)
+
+
+def touch(path, offset):
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + offset))
+
+
+def test_reuse_sources_until_inputs_change(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    for name in ["a.c", "a.h", "b.h", "c.txt"]:
+        write(name, "")
+    write("a.d", "a.h")
+
+    calls = []
+    tasks = create_tasks(calls)
+
+    _, graph = resolve(tasks, ["a.o", "c.txt"])
+    assert calls == ["a.o"]
+    assert graph.hits == 0
+
+    executor, graph = resolve(tasks, ["a.o", "c.txt"])
+    assert calls == ["a.o"]
+    # a.o, a.c, a.h and c.txt
+    assert graph.hits == 4
+    assert executor.job_pool.jobs["a.o"].ctx.sources == ["a.c", "a.h"]
+
+    write("a.d", "a.h b.h")
+    touch("a.d", 10**9)
+    executor, _ = resolve(tasks, ["a.o"])
+    assert calls == ["a.o", "a.o"]
+    assert executor.job_pool.jobs["a.o"].ctx.sources == ["a.c", "a.h", "b.h"]
+
+
+def test_undeclared_callables_always_run(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+    calls = []
+    tasks = create_tasks(calls)
+
+    resolve(tasks, ["a.x"])
+    resolve(tasks, ["a.x"])
+    assert calls == ["a.x", "a.x"]
+
+
+def test_discarded_when_rules_change(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write("a.c", "")
+    write("a.d", "")
+
+    calls = []
+    resolve(create_tasks(calls), ["a.o"])
+
+    tasks = create_tasks(calls)
+    tasks.insert(
+        0,
+        Task(
+            matcher=PercentPatternMatcher(target="%.o", sources=["%.cpp"]),
+            handler=lambda ctx: None,
+        ),
+    )
+    write("a.cpp", "")
+
+    executor, graph = resolve(tasks, ["a.o"])
+    assert graph.hits == 0
+    assert executor.job_pool.jobs["a.o"].ctx.sources == ["a.cpp"]
+
+
+def test_discarded_when_makefile_changes(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write("a.c", "")
+    write("a.d", "")
+    # Callables may read globals the rules don't show
+    write("Makefile.py", 'EXTRA = "a.h"\n')
+
+    calls = []
+    tasks = create_tasks(calls)
+    resolve(tasks, ["a.o"], script="Makefile.py")
+    _, graph = resolve(tasks, ["a.o"], script="Makefile.py")
+    assert graph.hits > 0
+
+    write("Makefile.py", 'EXTRA = "b.h"\n')
+    _, graph = resolve(tasks, ["a.o"], script="Makefile.py")
+    assert graph.hits == 0
+    assert calls == ["a.o", "a.o"]
@@ -0,0 +1,84 @@
+import os
+
+from make_py.history import CACHE_HIT, CACHE_NONE, STATUS_FAILED, History
+from make_py.task import Task
+
+
+class FakeJob:
+    def __init__(self, target, start, duration, dependency=None, **options):
+        def compile(ctx):
+            pass
+
+        self.target = target
+        self.task = Task(matcher=None, handler=compile, **options)
+        self.start = start
+        self.duration = duration
+        self.last_dependency = dependency
+        self.failed = False
+        self.cached = False
+
+
+def build(history, offset=0.0):
+    a = FakeJob("a.o", 100.0, 2.0)
+    b = FakeJob("b.o", 100.0, 1.0, cache=True)
+    b.cached = True
+    c = FakeJob("c.o", 101.0, 0.5)
+    c.failed = True
+    link = FakeJob("main", 102.0, 3.0 + offset, dependency=a)
+    up_to_date = FakeJob("d.o", None, 0.0)
+
+    history.record([a, b, c, link, up_to_date], 2, 100.0, 105.0 + offset)
+
+
+def test_record_and_query(tmp_path):
+    history = History(str(tmp_path / "history.bin"))
+    build(history)
+    build(history, offset=1.0)
+
+    # A new History reads what was recorded
+    history = History(str(tmp_path / "history.bin"))
+    builds = history.builds()
+    assert [b.id for b in builds] == [1, 2]
+
+    last = history.last_build()
+    assert last.jobs == 2
+    assert last.wall == 6.0
+    records = {record.target: record for record in last.records}
+    assert sorted(records) == ["a.o", "b.o", "c.o", "main"]
+    assert records["main"].start == 2.0
+    assert records["main"].duration == 4.0
+    assert records["b.o"].cache == CACHE_HIT
+    assert records["a.o"].cache == CACHE_NONE
+    assert records["c.o"].status == STATUS_FAILED
+    assert records["a.o"].rule == "compile"
+
+    assert [record.target for record in last.critical_path] == ["a.o", "main"]
+    assert last.parallelism == 7.5 / 6.0
+    assert history.durations()["main"] == 4.0
+
+    summary = history.summary()
+    assert "Parallelism: 1.25 of -j 2" in summary
+    assert "Critical path (6.000s)" in summary
+
+
+def test_compaction(tmp_path):
+    path = str(tmp_path / "history.bin")
+    history = History(path, max_size=400)
+    old = FakeJob("old.o", 0.0, 7.0)
+    history.record([old], 1, 0.0, 7.0)
+
+    for _ in range(5):
+        build(history)
+        assert os.path.getsize(path) <= 400
+
+    history = History(path)
+    assert len(history.builds()) < 6
+    # Durations of targets missing from the kept builds survive compaction
+    assert history.durations()["old.o"] == 7.0
+    assert history.durations()["main"] == 3.0
+
+
+def test_large_job_limit(tmp_path):
+    history = History(str(tmp_path / "history.bin"))
+    history.record([FakeJob("a.o", 0.0, 1.0)], 100000, 0.0, 1.0)
+    assert History(str(tmp_path / "history.bin")).last_build().jobs == 100000
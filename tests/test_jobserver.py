@@ -0,0 +1,121 @@
+import os
+import shutil
+from subprocess import STDOUT, check_output
+from threading import Lock
+from time import sleep
+
+import pytest
+
+from make_py.executor import Executor, JobPool
+from make_py.jobserver import (
+    JobServer,
+    JobServerClient,
+    jobserver_auth,
+    jobserver_fds,
+    makeflags_jobs,
+)
+from make_py.matcher import PlainTextMatcher, RegularExpressionMatcher
+from make_py.task import Context, Task
+
+from test_executor import TestFileSystem
+
+
+def test_parse_makeflags():
+    makeflags = " -j4 --jobserver-fds=3,4 --jobserver-auth=5,6"
+    assert jobserver_auth(makeflags) == "5,6"
+    assert jobserver_fds(makeflags) == (5, 6)
+    assert makeflags_jobs(makeflags) == 4
+
+    assert jobserver_auth("-k") is None
+    assert makeflags_jobs("-k") is None
+    assert jobserver_fds("--jobserver-auth=fifo:/tmp/fifo") == ()
+
+
+def test_tokens(monkeypatch):
+    monkeypatch.setenv("MAKEFLAGS", "-k")
+    server = JobServer(3)
+    # Only told to processes started by the Context helpers
+    assert os.environ["MAKEFLAGS"] == "-k"
+    assert server.makeflags.startswith("-k -j3 --jobserver-auth=")
+    client = JobServerClient.connect(server.makeflags)
+
+    # Both get an implicit token, and share the two in the pipe
+    assert server.acquire() is None
+    assert client.acquire() is None
+    assert client.acquire() == b"+"
+    assert server.acquire() == b"+"
+
+    os.set_blocking(server.read_fd, False)
+    with pytest.raises(BlockingIOError):
+        os.read(server.read_fd, 1)
+
+    server.close()
+
+
+def test_jobserver_limits_jobs(monkeypatch):
+    monkeypatch.delenv("MAKEFLAGS", raising=False)
+    running = 0
+    most_running = 0
+    lock = Lock()
+
+    def handler(ctx):
+        nonlocal running, most_running
+        with lock:
+            running += 1
+            most_running = max(most_running, running)
+        sleep(0.05)
+        with lock:
+            running -= 1
+
+    tasks = [
+        Task(
+            matcher=PlainTextMatcher(target="all", sources=["a1", "a2", "a3"]),
+            handler=lambda _: None,
+            phony=True,
+        ),
+        Task(
+            matcher=RegularExpressionMatcher(target="a\\d", sources=[]),
+            handler=handler,
+            phony=True,
+        ),
+    ]
+
+    jobserver = JobServer(2)
+    executor = Executor(
+        TestFileSystem({}), JobPool(), tasks, silent=True, jobs=4, jobserver=jobserver
+    )
+    executor.execute("all")
+    jobserver.close()
+
+    assert most_running == 2
+
+
+@pytest.mark.skipif(shutil.which("make") is None, reason="make is not installed")
+def test_child_make_uses_jobserver(tmp_path, monkeypatch):
+    monkeypatch.delenv("MAKEFLAGS", raising=False)
+    (tmp_path / "Makefile").write_text("all:\n\t@echo built\n")
+
+    jobserver = JobServer(4)
+    try:
+        ctx = Context(sources=[], target="all")
+        output = ctx.check_output(["make", "-C", str(tmp_path)], stderr=STDOUT)
+    finally:
+        jobserver.close()
+
+    assert b"built" in output
+    assert b"jobserver unavailable" not in output
+
+
+@pytest.mark.skipif(shutil.which("make") is None, reason="make is not installed")
+def test_plain_subprocess_unaffected(tmp_path, monkeypatch):
+    monkeypatch.delenv("MAKEFLAGS", raising=False)
+    (tmp_path / "Makefile").write_text("all:\n\t@echo built\n")
+
+    jobserver = JobServer(4)
+    try:
+        output = check_output(["make", "-C", str(tmp_path)], stderr=STDOUT)
+    finally:
+        jobserver.close()
+
+    assert b"built" in output
+    assert b"jobserver unavailable" not in output
@@ -3,6 +3,8 @@ from make_py.matcher import (
     PercentPatternMatcher,
     PlainTextMatcher,
 )
+from make_py.rule_index import RuleIndex
+from make_py.task import Task
 
 
 def test_regex_matcher():
@@ -32,3 +34,62 @@ def test_plain_text_matcher():
     assert ctx is not None
     assert ctx.target == "{filename.#-+}"
     assert ctx.sources == ["{}{}"]
+
+
+def make_tasks(*matchers):
+    return [Task(matcher=matcher, handler=lambda _: None) for matcher in matchers]
+
+
+def test_rule_index_first_match_wins():
+    tasks = make_tasks(
+        RegularExpressionMatcher(target=r"build/(.*)\.o", sources=["regex"]),
+        PercentPatternMatcher(target="build/%.o", sources=["percent"]),
+        PlainTextMatcher(target="build/main.o", sources=["plain"]),
+    )
+    index = RuleIndex(tasks)
+
+    task, ctx = index.match("build/main.o")
+    assert task is tasks[0]
+    assert ctx.sources == ["regex"]
+
+    index = RuleIndex(tasks[::-1])
+    task, ctx = index.match("build/main.o")
+    assert task is tasks[2]
+    assert ctx.sources == ["plain"]
+
+    task, ctx = index.match("build/other.o")
+    assert task is tasks[1]
+    assert ctx.sources == ["percent"]
+
+
+def test_rule_index_percent_candidates():
+    tasks = make_tasks(
+        PercentPatternMatcher(target="build/%.o", sources=["%.c"]),
+        PercentPatternMatcher(target="%.txt", sources=[]),
+        PercentPatternMatcher(target="%-%.txt", sources=["%.txt"]),
+        PercentPatternMatcher(target="%", sources=[]),
+    )
+    index = RuleIndex(tasks)
+
+    assert index.candidates("build/a.o") == [0, 3]
+    assert index.candidates("a-b.txt") == [1, 2, 3]
+    assert index.candidates("build/a.c") == [3]
+
+    task, ctx = index.match("a-b.txt")
+    assert task is tasks[1]
+
+    task, ctx = RuleIndex(tasks[2:]).match("a-b.txt")
+    assert ctx.sources == ["a.txt"]
+
+
+def test_rule_index_no_match():
+    index = RuleIndex(
+        make_tasks(
+            PlainTextMatcher(target="all", sources=[]),
+            PercentPatternMatcher(target="build/%.o", sources=[]),
+            RegularExpressionMatcher(target=r"(.*)\.c", sources=[]),
+        )
+    )
+
+    assert index.match("build/a.h") == (None, None)
+    assert index.match("al") == (None, None)
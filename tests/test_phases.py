@@ -0,0 +1,57 @@
+import pstats
+
+from make_py.executor import Executor, JobPool
+from make_py.filesystem import FileSystem
+from make_py.matcher import PercentPatternMatcher, PlainTextMatcher
+from make_py.phases import PhaseProfiler
+from make_py.rule_index import RuleIndex
+from make_py.task import Task
+
+
+def test_phase_counts(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "a.c").write_text("")
+
+    def headers(target, args):
+        return []
+
+    rules = RuleIndex(
+        [
+            Task(
+                matcher=PlainTextMatcher(target="all", sources=["a.o"]),
+                handler=lambda ctx: None,
+                phony=True,
+            ),
+            Task(
+                matcher=PercentPatternMatcher(target="%.o", sources=["%.c", headers]),
+                handler=lambda ctx: open(ctx.target, "w").close(),
+            ),
+        ]
+    )
+
+    fs = FileSystem()
+    profiler = PhaseProfiler(str(tmp_path / "resolve.prof"))
+    profiler.install(fs)
+    profiler.install_rules(rules)
+    try:
+        executor = Executor(fs, JobPool(), rules, silent=True)
+        profiler.install_executor(executor)
+        executor.execute("all")
+    finally:
+        profiler.uninstall()
+
+    counts = profiler.counts
+    assert counts["rules loaded"] == 2
+    # The rule index never tries "%.o" on a.c
+    assert counts["matcher calls"] == 2
+    assert counts["regex matches"] == 2
+    assert counts["callables invoked"] == 1
+    assert counts["stats issued"] >= 3
+    assert counts["jobs"] == 2
+    assert profiler.times["resolve"] > 0
+    assert profiler.times["build"] > 0
+
+    report = profiler.report({"graph cache hits": 0})
+    assert "graph cache hits" in report
+    stats = pstats.Stats(str(tmp_path / "resolve.prof"))
+    assert any(name == "resolve" for _, _, name in stats.stats)
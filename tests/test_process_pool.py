@@ -0,0 +1,104 @@
+import os
+
+import pytest
+
+from make_py.executor import Executor, JobPool
+from make_py.matcher import PlainTextMatcher, RegularExpressionMatcher
+from make_py.persistence import PersistentVariables
+from make_py.process_pool import ProcessPool
+from make_py.task import Context, Task
+
+from test_executor import TestFileSystem
+
+
+def test_run_in_process(tmp_path):
+    variables = PersistentVariables(tmp_path / "variables.json")
+    pid = variables["pid"]
+
+    tasks = [
+        Task(
+            matcher=PlainTextMatcher(target="pid", sources=[]),
+            handler=lambda ctx: pid.set(os.getpid()),
+            phony=True,
+            executor="process",
+        ),
+        Task(
+            matcher=PlainTextMatcher(target="thread", sources=["pid"]),
+            handler=lambda ctx: variables["thread"].set(pid.get()),
+            phony=True,
+        ),
+    ]
+
+    executor = Executor(TestFileSystem({}), JobPool(), tasks, silent=True, jobs=2)
+    executor.execute("thread")
+
+    assert pid.get() != os.getpid()
+    assert variables["thread"].get() == pid.get()
+
+
+def test_default_executor(tmp_path):
+    variables = PersistentVariables(tmp_path / "variables.json")
+    pid = variables["pid"]
+
+    tasks = [
+        Task(
+            matcher=PlainTextMatcher(target="pid", sources=[]),
+            handler=lambda ctx: pid.set(os.getpid()),
+            phony=True,
+        ),
+    ]
+
+    executor = Executor(
+        TestFileSystem({}), JobPool(), tasks, silent=True, executor="process"
+    )
+    executor.execute("pid")
+
+    assert pid.get() != os.getpid()
+
+
+def test_exception_propagation():
+    def fail(ctx):
+        raise ValueError(ctx.target)
+
+    task = Task(
+        matcher=PlainTextMatcher(target="fail", sources=[]),
+        handler=fail,
+        phony=True,
+    )
+
+    pool = ProcessPool([task], jobs=1)
+    try:
+        with pytest.raises(ValueError, match="fail"):
+            pool.run(task, Context(sources=[], target="fail"))
+    finally:
+        pool.shutdown()
+
+
+def test_concurrent_variables_merged(tmp_path):
+    variables = PersistentVariables(tmp_path / "variables.json")
+    variables["kept"].set(True)
+    variables["removed"].set(True)
+
+    def set_variable(ctx):
+        variables[ctx.target].set(1)
+        if ctx.target == "t0":
+            del variables.storage["removed"]
+
+    tasks = [
+        Task(
+            matcher=PlainTextMatcher(target="all", sources=[f"t{i}" for i in range(4)]),
+            handler=lambda ctx: None,
+            phony=True,
+        ),
+        Task(
+            matcher=RegularExpressionMatcher(target="t\\d", sources=[]),
+            handler=set_variable,
+            phony=True,
+            executor="process",
+        ),
+    ]
+
+    executor = Executor(TestFileSystem({}), JobPool(), tasks, silent=True, jobs=4)
+    executor.execute("all")
+
+    assert variables.storage == {"kept": True, "t0": 1, "t1": 1, "t2": 1, "t3": 1}
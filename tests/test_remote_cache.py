@@ -0,0 +1,101 @@
+from threading import Thread
+
+import pytest
+
+from make_py.cache import ENTRY, OUTPUT, ActionCache
+from make_py.remote_cache import (
+    DirectoryBackend,
+    HttpBackend,
+    RemoteCache,
+    create_server,
+)
+
+
+@pytest.fixture
+def http_backend(tmp_path):
+    server = create_server(tmp_path / "server")
+    thread = Thread(target=server.serve_forever)
+    thread.start()
+
+    host, port = server.server_address
+    backend = HttpBackend(f"http://{host}:{port}/cache")
+    try:
+        yield backend
+    finally:
+        backend.close()
+        server.shutdown()
+        server.server_close()
+        thread.join()
+
+
+@pytest.mark.parametrize("backend_type", ["directory", "http"])
+def test_share_between_caches(tmp_path, request, backend_type):
+    if backend_type == "http":
+        backend = request.getfixturevalue("http_backend")
+    else:
+        backend = DirectoryBackend(tmp_path / "shared")
+
+    output = tmp_path / "a.o"
+    output.write_bytes(b"object")
+
+    remote = RemoteCache(backend)
+    ActionCache(tmp_path / "first", remote=remote).store("ab12", [output])
+    remote.close()
+    entry_size = ENTRY.size + OUTPUT.size + 6
+    assert remote.bytes_uploaded == entry_size
+
+    remote = RemoteCache(backend)
+    second = ActionCache(tmp_path / "second", remote=remote)
+    restored = tmp_path / "restored.o"
+    assert second.restore("ab12", [restored])
+    assert not second.restore("cd34", [restored])
+
+    assert restored.read_bytes() == b"object"
+    assert second.entry("ab12").exists()
+    assert (remote.hits, remote.misses, remote.bytes_downloaded) == (1, 1, entry_size)
+
+
+def test_http_backend(http_backend):
+    assert http_backend.get("ab12") is None
+
+    http_backend.put("ab12", b"data")
+    http_backend.put("cd34", b"")
+
+    assert http_backend.get("ab12") == b"data"
+    assert http_backend.get("cd34") == b""
+    assert http_backend.contains(["ab12", "cd34", "ef56"]) == {"ab12", "cd34"}
+
+
+class CountingBackend:
+    def __init__(self, blobs):
+        self.blobs = blobs
+        self.gets = []
+
+    def get(self, key):
+        self.gets.append(key)
+        return self.blobs.get(key)
+
+    def put(self, key, data):
+        raise OSError("read only")
+
+    def contains(self, keys):
+        return set(keys) & set(self.blobs)
+
+    def close(self):
+        pass
+
+
+def test_prefetch_and_errors(tmp_path):
+    backend = CountingBackend({"ab12": b"data"})
+    remote = RemoteCache(backend)
+
+    remote.prefetch(["ab12", "cd34"])
+    assert not remote.fetch("cd34", tmp_path / "cd34")
+    assert remote.fetch("ab12", tmp_path / "ab12")
+    assert backend.gets == ["ab12"]
+
+    output = tmp_path / "a.o"
+    output.write_bytes(b"object")
+    remote.upload("ef56", output)
+    remote.close()
+    assert remote.errors == 1
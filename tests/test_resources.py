@@ -0,0 +1,105 @@
+from threading import Thread
+
+import pytest
+
+from make_py.executor import Executor, JobPool
+from make_py.matcher import PlainTextMatcher
+from make_py.resources import ResourceLimits, parse_size
+from make_py.scheduler import ReadyQueue
+from make_py.task import Task
+
+from test_executor import TestFileSystem
+
+
+class FakeJob:
+    def __init__(self, name, memory=0, priority=0):
+        self.name = name
+        self.task = Task(matcher=None, handler=None, memory=memory)
+        self.priority = priority
+
+
+@pytest.mark.parametrize(
+    "size, expected",
+    [(512, 512), ("512", 512), ("4k", 4096), ("1.5M", 3 << 19), ("2GB", 2 << 30)],
+)
+def test_parse_size(size, expected):
+    assert parse_size(size) == expected
+
+
+def test_load_limit():
+    load = [4.0]
+    limits = ResourceLimits(max_load=2.0, read_load=lambda: load[0])
+    queue = ReadyQueue(limits)
+    for name in ["a", "b"]:
+        queue.put(FakeJob(name))
+
+    # One job always runs
+    a = queue.get_nowait()
+    assert a is not None
+    assert queue.get_nowait() is None
+
+    load[0] = 1.0
+    assert queue.get_nowait() is not None
+
+
+def test_memory_skips_jobs_that_dont_fit():
+    limits = ResourceLimits(reserve_memory=100, read_memory=lambda: 1000)
+    queue = ReadyQueue(limits)
+    queue.put(FakeJob("small", memory=100))
+    queue.put(FakeJob("link", memory=800, priority=2))
+    queue.put(FakeJob("huge", memory=900, priority=1))
+
+    assert queue.get_nowait().name == "link"
+    # 1000 - 800 available, 100 kept in reserve
+    assert queue.get_nowait().name == "small"
+    assert queue.get_nowait() is None
+
+
+def test_held_back_jobs_start_when_others_finish():
+    limits = ResourceLimits(
+        reserve_memory=0, read_memory=lambda: 1000, retry_interval=60
+    )
+    queue = ReadyQueue(limits)
+    first = FakeJob("first", memory=600)
+    queue.put(first)
+    queue.put(FakeJob("second", memory=600))
+
+    assert queue.get() is first
+    started = []
+    waiting = Thread(target=lambda: started.append(queue.get()))
+    waiting.start()
+
+    queue.task_done(first)
+    waiting.join(timeout=5)
+    assert started[0].name == "second"
+
+
+def test_executor_with_limits():
+    built = []
+    tasks = [
+        Task(
+            matcher=PlainTextMatcher(target="all", sources=["a", "b"]),
+            handler=lambda ctx: built.append(ctx.target),
+            phony=True,
+        ),
+        Task(
+            matcher=PlainTextMatcher(target="a", sources=[]),
+            handler=lambda ctx: built.append(ctx.target),
+            memory="1G",
+        ),
+        Task(
+            matcher=PlainTextMatcher(target="b", sources=[]),
+            handler=lambda ctx: built.append(ctx.target),
+            memory="1G",
+        ),
+    ]
+
+    limits = ResourceLimits(max_load=0.0, read_load=lambda: 100.0)
+    executor = Executor(
+        TestFileSystem({}), JobPool(), tasks, silent=True, jobs=4, limits=limits
+    )
+    executor.execute("all")
+
+    assert sorted(built[:2]) == ["a", "b"]
+    assert built[2] == "all"
+    assert limits.running == 0
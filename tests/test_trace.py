@@ -0,0 +1,62 @@
+import json
+
+from make_py.executor import Executor, JobPool
+from make_py.filesystem import FileSystem
+from make_py.matcher import PercentPatternMatcher, PlainTextMatcher
+from make_py.task import Task
+from make_py.trace import Tracer
+
+
+def test_trace(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "a.c").write_text("")
+    (tmp_path / "b.c").write_text("")
+
+    def headers(target, args):
+        return []
+
+    tasks = [
+        Task(
+            matcher=PlainTextMatcher(target="all", sources=["a.o", "b.o"]),
+            handler=lambda ctx: None,
+            phony=True,
+        ),
+        Task(
+            matcher=PercentPatternMatcher(target="%.o", sources=["%.c", headers]),
+            handler=lambda ctx: open(ctx.target, "w").close(),
+        ),
+    ]
+
+    fs = FileSystem()
+    tracer = Tracer()
+    tracer.install(fs)
+    try:
+        executor = Executor(fs, JobPool(), tasks, silent=True, jobs=2, tracer=tracer)
+        executor.execute("all")
+    finally:
+        tracer.uninstall()
+
+    tracer.dump("trace.json")
+    with open("trace.json") as f:
+        events = json.load(f)["traceEvents"]
+
+    by_category = {}
+    for event in events:
+        by_category.setdefault(event.get("cat"), []).append(event)
+
+    jobs = by_category["job"]
+    assert sorted(event["name"] for event in jobs) == ["a.o", "all", "b.o"]
+    assert {event["tid"] for event in jobs} <= {1, 2}
+    assert all(event["args"]["ran"] for event in jobs)
+
+    assert [event["name"] for event in by_category["resolve"]] == ["resolve"]
+    assert by_category["resolve"][0]["args"]["source_calls"] == 2
+    assert {event["args"]["target"] for event in by_category["source"]} == {
+        "a.o",
+        "b.o",
+    }
+    assert "a.c" in {event["args"]["path"] for event in by_category["fs"]}
+    assert len(by_category["handler"]) == 3
+
+    names = {event["tid"]: event["args"]["name"] for event in by_category[None]}
+    assert names[0] == "main"
@@ -0,0 +1,93 @@
+from pathlib import Path
+
+from make_py.__main__ import create_arg_parser
+from make_py.session import Session
+from make_py.task import TASKS
+from make_py.watch import WatchLoop
+from make_py.watcher import PollingWatcher
+
+MAKEFILE = """
+from pathlib import Path
+
+from make_py import rule
+
+
+def listed_dependencies(target, args):
+    return Path("deps.txt").read_text().split()
+
+
+@rule("out.txt", ["in.txt", listed_dependencies])
+def concat(ctx):
+    with open(ctx.target, "w") as t:
+        for source in ctx.sources:
+            t.write(Path(source).read_text())
+"""
+
+
+def test_watch(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    Path("Makefile.py").write_text(MAKEFILE)
+    Path("in.txt").write_text("in\n")
+    Path("deps.txt").write_text("")
+
+    TASKS.clear()
+    session = Session(create_arg_parser().parse_args(["out.txt"]))
+    loop = WatchLoop(session, ["out.txt"], PollingWatcher(interval=0.01), 0.05)
+
+    loop.build()
+    assert Path("out.txt").read_text() == "in\n"
+
+    # New dependencies listed by the callable source are picked up
+    Path("extra.txt").write_text("extra\n")
+    Path("deps.txt").write_text("extra.txt")
+    assert "extra.txt" in loop.wait_for_changes()
+
+    loop.build()
+    assert Path("out.txt").read_text() == "in\nextra\n"
+    assert "extra.txt" in session.touched
+
+    capsys.readouterr()
+    Path("extra.txt").write_text("changed\n")
+    assert loop.wait_for_changes() == {"extra.txt"}
+
+    loop.build()
+    assert Path("out.txt").read_text() == "in\nchanged\n"
+    assert capsys.readouterr().out == "[1/1] concat: out.txt <- in.txt, extra.txt\n"
+
+    loop.watcher.close()
+    session.close()
+
+
+BROKEN_MAKEFILE = """
+from pathlib import Path
+
+from make_py import rule
+
+
+def listed_dependencies(target, args):
+    return Path("deps.txt").read_text().split()
+
+
+@rule("out.txt", ["in.txt", listed_dependencies])
+def build(ctx):
+    Path("deps.txt").write_text("missing.txt")
+    Path(ctx.target).write_text("out")
+"""
+
+
+def test_resolve_errors_reported(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    Path("Makefile.py").write_text(BROKEN_MAKEFILE)
+    Path("in.txt").write_text("in\n")
+    Path("deps.txt").write_text("")
+
+    TASKS.clear()
+    session = Session(create_arg_parser().parse_args(["out.txt"]))
+    loop = WatchLoop(session, ["out.txt"], PollingWatcher(interval=0.01), 0.05)
+
+    # The build lists a dependency there is no rule for
+    loop.build()
+    assert "No rules to make target 'missing.txt'" in capsys.readouterr().err
+
+    loop.watcher.close()
+    session.close()
@@ -0,0 +1,43 @@
+import os
+
+import pytest
+
+from make_py.watcher import InotifyWatcher, PollingWatcher
+
+
+@pytest.fixture(params=["polling", "inotify"])
+def watcher(request):
+    if request.param == "polling":
+        watcher = PollingWatcher(interval=0.01)
+    else:
+        try:
+            watcher = InotifyWatcher()
+        except (OSError, AttributeError):
+            pytest.skip("inotify is not available")
+
+    yield watcher
+    watcher.close()
+
+
+def test_watch_changes(tmp_path, monkeypatch, watcher):
+    monkeypatch.chdir(tmp_path)
+    os.mkdir("src")
+    with open("src/a.c", "w") as f:
+        f.write("a")
+    with open("b.c", "w") as f:
+        f.write("b")
+
+    watcher.watch(["src/a.c", "b.c"])
+    assert watcher.wait(timeout=0) == set()
+
+    with open("src/a.c", "w") as f:
+        f.write("changed")
+    assert "src/a.c" in watcher.wait(timeout=1)
+
+    with open("src/new.h", "w") as f:
+        f.write("new")
+    assert "src/new.h" in watcher.wait(timeout=1)
+
+    os.unlink("b.c")
+    assert "b.c" in watcher.wait(timeout=1)
+    assert watcher.wait(timeout=0) == set()